@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+'''
+    Times every phase of the bundled workloads separately and prints the results as JSON:
+        python benchmark.py [--datasets cmc mushroom income] [--scales 1 10 100] [--repeat 3] [--seed 0] [--output results.json]
+    Scales > 1 are applied to income.data only: the file is replicated that many times into a temporary file.
+'''
+
+__copyright__ = "Copyright 2020, Piotr Obst"
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+import matplotlib
+matplotlib.use('Agg')  # never open a window while benchmarking
+import numpy as np
+
+from datasets import DATASETS
+from evaluation import RocCurve
+import plotting
+
+
+SCALED_DATASETS = ['income']
+
+
+class Benchmark:
+
+    def __init__(self, repeat: int, seed: int, plot_folder: str):
+        self.repeat = repeat
+        self.seed = seed
+        self.plot_folder = plot_folder
+
+    def measure(self, phase: Callable, rows: int, setup: Callable = None) -> Tuple[Dict, Any]:
+        # best wall time of `repeat` runs, then one extra run under tracemalloc for the peak allocation;
+        # setup() isn't measured, its result is passed to phase
+        best = float('inf')
+        for _ in range(self.repeat):
+            argument = () if setup is None else (setup(),)
+            start = time.perf_counter()
+            result = phase(*argument)
+            best = min(best, time.perf_counter() - start)
+        argument = () if setup is None else (setup(),)
+        tracemalloc.start()
+        phase(*argument)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {
+            'seconds': best,
+            'rows': rows,
+            'rows_per_second': rows / best if best > 0 else None,
+            'peak_memory_bytes': peak,
+        }, result
+
+    def run(self, name: str, filename: str, scale: int) -> Dict:
+        dataset_class = DATASETS[name]
+        phases = dict()
+        print(f'benchmarking {name} x{scale}', file = sys.stderr)
+
+        phases['load'], raw = self.measure(lambda: dataset_class.load(filename, self.seed), 0)
+        phases['load']['rows'] = len(raw)
+        phases['load']['rows_per_second'] = len(raw) / phases['load']['seconds'] if phases['load']['seconds'] > 0 else None
+        # clean modifies lines in place, so every run gets a fresh copy
+        phases['clean'], dataset = self.measure(dataset_class.clean, len(raw), setup = lambda: [list(line) for line in raw])
+        del raw
+        nb, positive, negative = dataset_class.build_model()
+        phases['encode'], (codes, response_ids) = self.measure(lambda: (nb.encode(dataset), nb.encode_responses(dataset)), len(dataset))
+
+        def train():
+            model, _, _ = dataset_class.build_model()
+            model.load_encoded(codes, response_ids)
+            return model
+        phases['train'], nb = self.measure(train, len(dataset))
+        phases['predict'], probabilities = self.measure(lambda: nb.predict_proba_encoded(codes), len(dataset))
+
+        positive_id = nb.get_response_id(positive)
+        scores = probabilities[:, positive_id].tolist()
+        labels = (response_ids == positive_id).tolist()
+        phases['roc'], roc = self.measure(lambda: RocCurve.from_scores(scores, labels), len(dataset))
+
+        phases['plot'], _ = self.measure(lambda: plotting.plot_roc(roc, name, 'b-', os.path.join(self.plot_folder, f'{name}.png')), len(roc.grid_fpr))
+        return {'dataset': name, 'scale': scale, 'rows': len(dataset), 'auc': roc.auc, 'phases': phases}
+
+
+def replicate(filename: str, scale: int, folder: str) -> str:
+    scaled_filename = os.path.join(folder, f'{scale}x_{os.path.basename(filename)}')
+    with open(filename, 'rb') as source:
+        content = source.read()
+    if not content.endswith(b'\n'):
+        content += b'\n'
+    with open(scaled_filename, 'wb') as destination:
+        for _ in range(scale):
+            destination.write(content)
+    return scaled_filename
+
+
+def main(arguments: List[str]):
+    parser = argparse.ArgumentParser(description = 'Benchmark load/clean/encode/train/predict/ROC/plot phases on the bundled datasets.')
+    parser.add_argument('--datasets', nargs = '+', choices = list(DATASETS.keys()), default = list(DATASETS.keys()))
+    parser.add_argument('--scales', nargs = '+', type = int, default = [1, 10, 100])
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--output', help = 'write JSON here instead of standard output')
+    args = parser.parse_args(arguments)
+
+    results = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'results': list(),
+    }
+    folder = tempfile.mkdtemp(prefix = 'nb_benchmark_')
+    try:
+        benchmark = Benchmark(args.repeat, args.seed, folder)
+        for name in args.datasets:
+            filename = DATASETS[name].SCHEMA.definition['filename']
+            for scale in (args.scales if name in SCALED_DATASETS else [1]):
+                scaled_filename = filename if scale == 1 else replicate(filename, scale, folder)
+                results['results'].append(benchmark.run(name, scaled_filename, scale))
+                if scaled_filename != filename:
+                    os.remove(scaled_filename)
+    finally:
+        shutil.rmtree(folder, ignore_errors = True)
+
+    output = json.dumps(results, indent = 2)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
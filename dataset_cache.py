@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+__copyright__ = "Copyright 2020, Piotr Obst"
+
+# on-disk cache of cleaned, encoded datasets, so repeated runs skip parsing and cleaning
+
+import hashlib
+import json
+import os
+from random import Random, shuffle
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+import instrumentation
+from naive_bayes import NaiveBayes, Util
+
+
+CACHE_FOLDER = '.dataset_cache'
+CACHE_VERSION = 1  # part of the key, increment when the stored format or the encoding changes
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class DatasetCache:
+    '''
+        One entry per (source file content, schema definition), named by the sha256 of both:
+            <key>.codes.npy         accepted rows x features, in file order
+            <key>.response_ids.npy
+            <key>.rows.npy          line number (among parsed lines) of every accepted row
+            <key>.json              vocabularies and the number of parsed lines; written last, so an entry without it is ignored
+        Arrays are memory-mapped when loaded; rows are then put in the order Util.load_file would have shuffled them into.
+    '''
+
+    def __init__(self, folder: str = CACHE_FOLDER):
+        self.folder = folder
+
+    @staticmethod
+    def hash_file(filename: str) -> str:
+        digest = hashlib.sha256()
+        with open(filename, 'rb') as file:
+            for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def get_key(filename: str, definition: Dict) -> str:
+        digest = hashlib.sha256()
+        digest.update(f'{CACHE_VERSION}\n{DatasetCache.hash_file(filename)}\n'.encode('utf-8'))
+        definition = {key: value for key, value in definition.items() if key != 'filename'}  # the content matters, not the name
+        digest.update(json.dumps(definition, sort_keys = True).encode('utf-8'))
+        return digest.hexdigest()
+
+    @staticmethod
+    def get_vocabularies(nb: NaiveBayes) -> Dict:
+        return {'responses': list(nb.responses.keys()), 'features': [list(feature.categories.keys()) for feature in nb.features]}
+
+    def get_path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.folder, f'{key}.{suffix}')
+
+    def load(self, schema, nb: Optional[NaiveBayes] = None, filename: Optional[str] = None,
+             seed: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:  # (codes, response_ids) like schema.load_encoded
+        nb = nb if nb is not None else schema.build_model()
+        filename = filename or schema.definition['filename']
+        with instrumentation.timer('load'):
+            key = DatasetCache.get_key(filename, schema.definition)
+            entry = self.read(key, nb)
+            if entry is None:
+                entry = self.write(key, nb, schema, filename)
+            codes, response_ids, rows, num_of_lines = entry
+            # same permutation of the parsed lines as Util.load_file, then only the accepted ones
+            order = list(range(num_of_lines))
+            if seed is None:
+                shuffle(order)
+            else:
+                Random(seed).shuffle(order)
+            code_ids = np.full(num_of_lines, -1, dtype = np.intp)
+            code_ids[rows] = np.arange(len(rows))
+            code_ids = code_ids[np.array(order, dtype = np.intp)]
+            code_ids = code_ids[code_ids >= 0]
+            codes, response_ids = codes[code_ids], response_ids[code_ids]
+        instrumentation.count('rows_loaded', len(codes))
+        return (codes, response_ids)
+
+    def read(self, key: str, nb: NaiveBayes) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, int]]:
+        try:
+            with open(self.get_path(key, 'json'), 'r') as file:
+                header = json.load(file)
+            if header['vocabularies'] != DatasetCache.get_vocabularies(nb):  # a model with different categories, codes don't apply
+                return None
+            arrays = [np.load(self.get_path(key, f'{name}.npy'), mmap_mode = 'r') for name in ('codes', 'response_ids', 'rows')]
+        except (OSError, ValueError, KeyError):
+            return None
+        return (arrays[0], arrays[1], arrays[2], header['num_of_lines'])
+
+    def write(self, key: str, nb: NaiveBayes, schema, filename: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+        definition = schema.definition
+        lines = [line for batch in Util.iter_file(filename, definition['class_attribute_index'], definition['delimiter']) for line in batch]
+        num_of_lines = len(lines)
+        encoder = schema.compile_encoder(nb)
+        rows = np.array([i for i in range(num_of_lines) if encoder.accepts(lines[i])], dtype = np.intp)
+        codes, response_ids = encoder.encode([lines[i] for i in rows])
+
+        os.makedirs(self.folder, exist_ok = True)
+        for name, array in (('codes', codes), ('response_ids', response_ids), ('rows', rows)):
+            temporary = self.get_path(key, f'{name}.npy.tmp')
+            with open(temporary, 'wb') as file:
+                np.save(file, array)
+            os.replace(temporary, self.get_path(key, f'{name}.npy'))
+        temporary = self.get_path(key, 'json.tmp')
+        with open(temporary, 'w') as file:
+            json.dump({'source': filename, 'num_of_lines': num_of_lines, 'vocabularies': DatasetCache.get_vocabularies(nb)}, file)
+        os.replace(temporary, self.get_path(key, 'json'))
+        return (codes, response_ids, rows, num_of_lines)
+
+    def clear(self):  # removes every entry, stale ones included
+        if not os.path.isdir(self.folder):
+            return
+        for name in os.listdir(self.folder):
+            if name.endswith('.npy') or name.endswith('.json') or name.endswith('.tmp'):
+                os.remove(os.path.join(self.folder, name))
@@ -0,0 +1,12 @@
+#!/usr/bin/env python
+
+__copyright__ = "Copyright 2020, Piotr Obst"
+
+# the bundled datasets by their command line names
+
+from cmc import CMC
+from income import Income
+from mushroom import Mushroom
+
+
+DATASETS = {'cmc': CMC, 'mushroom': Mushroom, 'income': Income}
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+__copyright__ = "Copyright 2020, Piotr Obst"
+
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+LOG_LOSS_EPSILON = 1e-15  # probabilities are clipped to [eps, 1 - eps] for the log-loss
+
+
+def sweep(scores: np.ndarray, labels: np.ndarray, weights: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # (thresholds, true positives, false positives) after every distinct score, walking from the highest score;
+    # weights: how many rows each score stands for, e.g. counts of compressed duplicate rows
+    order = np.argsort(-scores, kind = 'stable')
+    scores = scores[order]
+    labels = labels[order]
+    last_of_score = np.append(scores[1:] != scores[:-1], True) if len(scores) > 0 else np.zeros(0, dtype = bool)
+    if weights is None:
+        true_positives = np.cumsum(labels)[last_of_score]
+        false_positives = np.cumsum(~labels)[last_of_score]
+    else:
+        weights = weights[order]
+        true_positives = np.cumsum(weights * labels)[last_of_score]
+        false_positives = np.cumsum(weights * ~labels)[last_of_score]
+    return (scores[last_of_score], true_positives, false_positives)
+
+
+def at_or_above(thresholds: np.ndarray, counts: np.ndarray, cut_off_points: np.ndarray) -> np.ndarray:
+    # cumulative counts of a sweep (descending thresholds) read at every cut-off point: the count of scores >= the cut-off
+    above = len(thresholds) - np.searchsorted(thresholds[::-1], cut_off_points, side = 'left')  # distinct scores >= cut-off
+    return np.concatenate(([0], counts))[above]
+
+
+def rates(counts: np.ndarray, total: int) -> np.ndarray:
+    return counts / total if total != 0 else np.zeros(len(counts))
+
+
+class RocCurve:
+
+    def __init__(self, fpr: List[float], tpr: List[float], thresholds: List[float], grid_fpr: List[float], grid_tpr: List[float]):
+        self.fpr = fpr  # exact curve, one point per distinct score
+        self.tpr = tpr
+        self.thresholds = thresholds
+        self.grid_fpr = grid_fpr  # fixed cut-off grid, duplicated x values averaged
+        self.grid_tpr = grid_tpr
+        self.auc = RocCurve.trapezoid(fpr, tpr)
+
+    @staticmethod
+    def trapezoid(x: List[float], y: List[float]) -> float:
+        area = 0.0
+        for i in range(1, len(x)):
+            area += (x[i] - x[i - 1]) * (y[i] + y[i - 1]) / 2
+        return area
+
+    @staticmethod
+    def from_scores(scores: Sequence[float], labels: Sequence[bool], data_points: int = 100, weights: Optional[Sequence[int]] = None) -> 'RocCurve':
+        # every row is scored once by the caller; all thresholds are swept over the sorted scores
+        scores = np.asarray(scores, dtype = np.float64)
+        labels = np.asarray(labels, dtype = bool)
+        weights = np.asarray(weights) if weights is not None else None
+        num_of_positives = int(labels.sum()) if weights is None else weights[labels].sum()
+        num_of_negatives = (len(labels) if weights is None else weights.sum()) - num_of_positives
+        return RocCurve.from_sweep(*sweep(scores, labels, weights), num_of_positives, num_of_negatives, data_points)
+
+    @staticmethod
+    def from_sweep(thresholds: np.ndarray, true_positives: np.ndarray, false_positives: np.ndarray, num_of_positives: int, num_of_negatives: int,
+                   data_points: int = 100) -> 'RocCurve':
+        # exact curve: a point after each distinct score, starting at (0, 0)
+        fpr = [0.0] + rates(false_positives, num_of_negatives).tolist()
+        tpr = [0.0] + rates(true_positives, num_of_positives).tolist()
+
+        # fixed grid: row is positive if score >= i / data_points
+        cut_off_points = np.arange(data_points) / data_points
+        grid_true_positives = at_or_above(thresholds, true_positives, cut_off_points)
+        grid_false_positives = at_or_above(thresholds, false_positives, cut_off_points)
+        xy_data_sum = dict()
+        xy_data_num = dict()
+        for x, y in zip(rates(grid_false_positives, num_of_negatives).tolist(), rates(grid_true_positives, num_of_positives).tolist()):
+            if x in xy_data_sum:
+                xy_data_sum[x] += y
+                xy_data_num[x] += 1
+            else:
+                xy_data_sum[x] = y
+                xy_data_num[x] = 1
+        grid_fpr = list(xy_data_sum.keys())
+        grid_tpr = [xy_data_sum[x] / xy_data_num[x] for x in grid_fpr]  # average y values for duplicated x values
+        return RocCurve(fpr, tpr, [float('inf')] + thresholds.tolist(), grid_fpr, grid_tpr)
+
+
+class PrecisionRecallCurve:
+
+    def __init__(self, precision: List[float], recall: List[float], thresholds: List[float]):
+        self.precision = precision  # one point per distinct score, from the highest threshold
+        self.recall = recall
+        self.thresholds = thresholds
+        self.average_precision = sum((recall[i] - (recall[i - 1] if i > 0 else 0.0)) * precision[i] for i in range(len(recall)))
+
+    @staticmethod
+    def from_sweep(thresholds: np.ndarray, true_positives: np.ndarray, false_positives: np.ndarray, num_of_positives: int) -> 'PrecisionRecallCurve':
+        precision = true_positives / np.maximum(true_positives + false_positives, 1)
+        return PrecisionRecallCurve(precision.tolist(), rates(true_positives, num_of_positives).tolist(), thresholds.tolist())
+
+
+class Evaluation:  # N-class metrics from one scored test set (rows x responses probabilities), rows optionally weighted
+
+    def __init__(self, probabilities: np.ndarray, response_ids: np.ndarray, responses: Optional[List[str]] = None, data_points: int = 100,
+                 weights: Optional[np.ndarray] = None):
+        num_of_responses = probabilities.shape[1]
+        self.responses = responses if responses is not None else [str(i) for i in range(num_of_responses)]
+        self.num_of_rows = len(response_ids) if weights is None else int(weights.sum())
+        predictions = probabilities.argmax(axis = 1)
+        # confusion_matrix[actual][predicted]
+        self.confusion_matrix = np.bincount(response_ids * num_of_responses + predictions, weights,
+                                            minlength = num_of_responses ** 2).astype(np.int64).reshape(num_of_responses, num_of_responses)
+        self.accuracy = float(np.trace(self.confusion_matrix) / self.num_of_rows) if self.num_of_rows > 0 else 0.0
+        correct_probabilities = np.clip(probabilities[np.arange(len(response_ids)), response_ids], LOG_LOSS_EPSILON, 1 - LOG_LOSS_EPSILON)
+        self.log_loss = float(-np.average(np.log(correct_probabilities), weights = weights)) if self.num_of_rows > 0 else 0.0
+
+        # one-vs-rest curves; ROC and precision-recall share one sweep per response
+        counts = np.bincount(response_ids, weights, minlength = num_of_responses)
+        self.rocs = list()
+        self.precision_recall_curves = list()
+        for i in range(num_of_responses):
+            thresholds, true_positives, false_positives = sweep(probabilities[:, i].astype(np.float64), response_ids == i, weights)
+            self.rocs.append(RocCurve.from_sweep(thresholds, true_positives, false_positives, counts[i], counts.sum() - counts[i], data_points))
+            self.precision_recall_curves.append(PrecisionRecallCurve.from_sweep(thresholds, true_positives, false_positives, counts[i]))
+        # a response without positive or without negative rows has no defined AUC and is left out of the average (NaN if none has one)
+        defined = [self.rocs[i].auc for i in range(num_of_responses) if 0 < counts[i] < counts.sum()]
+        self.macro_auc = float(np.mean(defined)) if defined else float('nan')
+
+    def get_precision(self, response_id: int) -> float:
+        predicted = self.confusion_matrix[:, response_id].sum()
+        return float(self.confusion_matrix[response_id, response_id] / predicted) if predicted > 0 else 0.0
+
+    def get_recall(self, response_id: int) -> float:
+        actual = self.confusion_matrix[response_id].sum()
+        return float(self.confusion_matrix[response_id, response_id] / actual) if actual > 0 else 0.0
+
+    def debug_print(self):
+        width = max([len(response) for response in self.responses] + [9]) + 2
+        print('actual \\ predicted'.ljust(20), end = '')
+        for response in self.responses:
+            print(response.ljust(width), end = '')
+        print()
+        for i in range(len(self.responses)):
+            print(self.responses[i].ljust(20, '.'), end = '')
+            for j in range(len(self.responses)):
+                print(str(self.confusion_matrix[i][j]).ljust(width), end = '')
+            print()
+        for i in range(len(self.responses)):
+            print(f'{self.responses[i]}: AUC {self.rocs[i].auc:.4f}, average precision {self.precision_recall_curves[i].average_precision:.4f}, '
+                  f'precision {self.get_precision(i):.4f}, recall {self.get_recall(i):.4f}')
+        print(f'accuracy {self.accuracy:.4f}, log-loss {self.log_loss:.4f}, macro AUC {self.macro_auc:.4f}')
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+'''
+    Ranks the features of a trained model and prunes the ones that don't help:
+        python feature_selection.py cmc|mushroom|income [--method mutual_information|chi_square] [--select forward|backward]
+                                    [--folds 3] [--smoothing 1.0] [--tolerance 0.0] [--output MODEL_FILE]
+    Rankings are computed from the count tables only; forward/backward selection compares cross-validated AUCs.
+    A pruned model expects rows with the kept columns only (see FeatureSelection.project_rows).
+'''
+
+__copyright__ = "Copyright 2020, Piotr Obst"
+
+import argparse
+import sys
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from naive_bayes import Feature, GaussianFeature, NaiveBayes, Util
+
+
+class FeatureSelection:
+
+    @staticmethod
+    def mutual_information(feature: Feature) -> float:  # I(feature; response) in nats
+        if isinstance(feature, GaussianFeature):
+            return FeatureSelection.gaussian_mutual_information(feature)
+        joint = feature.matrix.astype(np.float64)
+        total = joint.sum()
+        if total == 0:
+            return 0.0
+        joint /= total
+        expected = joint.sum(axis = 1, keepdims = True) * joint.sum(axis = 0, keepdims = True)  # p(category) * p(response)
+        nonzero = joint > 0
+        return float((joint[nonzero] * np.log(joint[nonzero] / expected[nonzero])).sum())
+
+    @staticmethod
+    def gaussian_mutual_information(feature: GaussianFeature) -> float:
+        # Gaussian approximation: h(value) - h(value | response) with both entropies taken as those of normal distributions
+        counts = feature.matrix[0]
+        total = counts.sum()
+        if total <= 0:
+            return 0.0
+        pooled = feature.clone_untrained()  # all rows as one response
+        pooled.matrix = np.zeros((3, 1))
+        for i in range(feature.num_of_responses):
+            pooled.add_counts(feature.matrix[:, i:i + 1])
+        known = counts > 0
+        conditional = (counts[known] / total * np.log(feature.get_variances()[known])).sum()
+        return float(max(0.5 * (np.log(pooled.get_variances()[0]) - conditional), 0.0))
+
+    @staticmethod
+    def chi_square(feature: Feature) -> float:  # independence test statistic of the category x response contingency table
+        if isinstance(feature, GaussianFeature):
+            raise ValueError(f'chi_square needs category counts, {feature.display_name} is a gaussian feature (use mutual_information)')
+        observed = feature.matrix.astype(np.float64)
+        total = observed.sum()
+        if total == 0:
+            return 0.0
+        expected = observed.sum(axis = 1, keepdims = True) * observed.sum(axis = 0, keepdims = True) / total
+        nonzero = expected > 0
+        return float(((observed[nonzero] - expected[nonzero]) ** 2 / expected[nonzero]).sum())
+
+    @staticmethod
+    def rank(nb: NaiveBayes, method: str = 'mutual_information', skipped: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        # [(feature, score)], best first; with a skipped list, features the method can't score (chi_square of a gaussian feature)
+        # are left out and their names appended to it instead of raising
+        score = METHODS[method]
+        scores = list()
+        for feature in nb.features:
+            if skipped is not None and method == 'chi_square' and isinstance(feature, GaussianFeature):
+                skipped.append(feature.display_name)
+                continue
+            scores.append((feature.display_name, score(feature)))
+        return sorted(scores, key = lambda item: item[1], reverse = True)
+
+    @staticmethod
+    def get_columns(nb: NaiveBayes, names: Sequence[str]) -> List[int]:  # in model order
+        names = set(names)
+        return [i for i in range(len(nb.features)) if nb.features[i].display_name in names]
+
+    @staticmethod
+    def prune(nb: NaiveBayes, columns: Sequence[int]) -> NaiveBayes:  # keeps the counts of the given features, no data is re-read
+        pruned = NaiveBayes()
+        for response in nb.responses:
+            pruned.add_response(response)
+        for i in sorted(columns):
+            feature = nb.features[i].clone_untrained()
+            feature.matrix = nb.features[i].matrix.copy()
+            pruned.add_feature(feature)
+        pruned.total_entries_per_response = nb.total_entries_per_response.copy()
+        pruned.num_of_entries = nb.num_of_entries
+        return pruned
+
+    @staticmethod
+    def select_top(nb: NaiveBayes, num_of_features: int, method: str = 'mutual_information') -> Tuple[NaiveBayes, List[int]]:
+        columns = FeatureSelection.get_columns(nb, [name for name, _ in FeatureSelection.rank(nb, method)[:num_of_features]])
+        return (FeatureSelection.prune(nb, columns), columns)
+
+    @staticmethod
+    def project_rows(rows: Sequence[List[str]], columns: Sequence[int]) -> List[List[str]]:  # class attribute stays last
+        columns = sorted(columns)
+        return [[row[i] for i in columns] + [row[-1]] for row in rows]
+
+    @staticmethod
+    def get_auc(nb_template: NaiveBayes, codes: np.ndarray, response_ids: np.ndarray, columns: Sequence[int], positive_id: int,
+                negative_id: int, k: int = 3, smoothing: Optional[float] = None) -> float:  # cross-validated AUC using only the given features
+        columns = sorted(columns)
+        cross_validation = Util.cross_validate_encoded(FeatureSelection.prune(nb_template, columns), codes[:, columns], response_ids, k,
+                                                       smoothing = smoothing)
+        return cross_validation.get_roc(positive_id, negative_id).auc
+
+    @staticmethod
+    def forward(nb_template: NaiveBayes, dataset: List[List[str]], positive: str, negative: str, k: int = 3, smoothing: Optional[float] = None,
+                tolerance: float = 0.0, max_features: Optional[int] = None) -> Tuple[NaiveBayes, List[Tuple[str, float]]]:
+        # greedy: adds the feature that improves the AUC most, stops when no feature improves it by more than tolerance
+        def step(selected: List[int], auc: Callable[[List[int]], float], current: float) -> Tuple[Optional[List[int]], float]:
+            if max_features is not None and len(selected) >= max_features:
+                return (None, current)
+            candidates = [selected + [i] for i in range(len(nb_template.features)) if i not in selected]
+            return FeatureSelection.best_candidate(candidates, auc, current + tolerance, strictly_better = True)
+        return FeatureSelection.select(nb_template, dataset, positive, negative, k, smoothing, list(), step)
+
+    @staticmethod
+    def backward(nb_template: NaiveBayes, dataset: List[List[str]], positive: str, negative: str, k: int = 3, smoothing: Optional[float] = None,
+                 tolerance: float = 0.0) -> Tuple[NaiveBayes, List[Tuple[str, float]]]:
+        # greedy: removes the feature whose removal costs the least, as long as the AUC drops by at most tolerance
+        def step(selected: List[int], auc: Callable[[List[int]], float], current: float) -> Tuple[Optional[List[int]], float]:
+            candidates = [[i for i in selected if i != removed] for removed in selected] if len(selected) > 1 else list()
+            return FeatureSelection.best_candidate(candidates, auc, current - tolerance, strictly_better = False)
+        return FeatureSelection.select(nb_template, dataset, positive, negative, k, smoothing, list(range(len(nb_template.features))), step)
+
+    @staticmethod
+    def best_candidate(candidates: List[List[int]], auc: Callable[[List[int]], float], threshold: float,
+                       strictly_better: bool) -> Tuple[Optional[List[int]], float]:  # (columns or None if none passes the threshold, their AUC)
+        best, best_auc = None, -1.0
+        for candidate in candidates:
+            candidate_auc = auc(candidate)
+            if candidate_auc > best_auc:
+                best, best_auc = candidate, candidate_auc
+        if best is None or best_auc < threshold or (strictly_better and best_auc == threshold):
+            return (None, best_auc)
+        return (best, best_auc)
+
+    @staticmethod
+    def select(nb_template: NaiveBayes, dataset: List[List[str]], positive: str, negative: str, k: int, smoothing: Optional[float],
+               selected: List[int], step) -> Tuple[NaiveBayes, List[Tuple[str, float]]]:  # (pruned model trained on the whole dataset, history)
+        # the dataset is encoded once, every candidate set is scored on column views of the same codes
+        codes = nb_template.encode(dataset)
+        response_ids = nb_template.encode_responses(dataset)
+        positive_id, negative_id = nb_template.get_response_id(positive), nb_template.get_response_id(negative)
+
+        def auc(columns: List[int]) -> float:
+            return FeatureSelection.get_auc(nb_template, codes, response_ids, columns, positive_id, negative_id, k, smoothing)
+
+        current = auc(selected)
+        history = [('(all)' if len(selected) > 0 else '(none)', current)]  # (feature added or removed, AUC afterwards)
+        while True:
+            candidate, candidate_auc = step(selected, auc, current)
+            if candidate is None:
+                break
+            changed = set(candidate) ^ set(selected)
+            history.append((('+' if len(candidate) > len(selected) else '-') + nb_template.features[changed.pop()].display_name, candidate_auc))
+            selected, current = candidate, candidate_auc
+
+        model = nb_template.clone_untrained()
+        model.load_encoded(codes, response_ids)
+        return (FeatureSelection.prune(model, selected), history)
+
+
+METHODS = {'mutual_information': FeatureSelection.mutual_information, 'chi_square': FeatureSelection.chi_square}
+
+
+def main(arguments: List[str]):
+    from datasets import DATASETS
+    parser = argparse.ArgumentParser(description = 'Rank the features of a bundled dataset and optionally prune them.')
+    parser.add_argument('dataset', choices = list(DATASETS.keys()))
+    parser.add_argument('--method', choices = list(METHODS.keys()), default = 'mutual_information')
+    parser.add_argument('--select', choices = ['forward', 'backward'], help = 'greedy selection using cross-validated AUC')
+    parser.add_argument('--folds', type = int, default = 3)
+    parser.add_argument('--smoothing', type = float, help = 'score folds with log-space tables using this Lidstone smoothing')
+    parser.add_argument('--tolerance', type = float, default = 0.0, help = 'AUC a feature must add (forward) or may cost (backward)')
+    parser.add_argument('--output', help = 'save the pruned model here (see model_io.py)')
+    args = parser.parse_args(arguments)
+
+    dataset_class = DATASETS[args.dataset]
+    dataset = dataset_class.clean(dataset_class.load())
+    nb, positive, negative = dataset_class.build_model()
+    trained = nb.clone_untrained()
+    trained.load_training_dataset(dataset)
+    skipped = list()
+    for name, score in FeatureSelection.rank(trained, args.method, skipped):
+        print(name.ljust(30, '.'), f'{score:.6f}')
+    for name in skipped:
+        print(name.ljust(30, '.'), f'not ranked, {args.method} needs category counts and this is a gaussian feature (use mutual_information)')
+
+    if args.select is not None:
+        select = FeatureSelection.forward if args.select == 'forward' else FeatureSelection.backward
+        trained, history = select(nb, dataset, positive, negative, args.folds, args.smoothing, args.tolerance)
+        print(f'{args.select} selection:')
+        for change, auc in history:
+            print(change.ljust(30, '.'), f'AUC {auc:.4f}')
+        print(f'kept {len(trained.features)} of {len(nb.features)} features:', ', '.join(feature.display_name for feature in trained.features))
+    if args.output is not None:
+        from model_io import ModelFile
+        ModelFile.save(trained, args.output)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+__copyright__ = "Copyright 2020, Piotr Obst"
+
+# opt-in counters and phase timers; while disabled every hook is a single `STATS is not None` check
+
+from contextlib import nullcontext
+import threading
+import time
+from typing import Dict, Optional
+
+
+PHASES = ['load', 'encode', 'train', 'predict', 'evaluate']
+COUNTERS = ['rows_loaded', 'rows_trained', 'rows_forgotten', 'rows_predicted', 'unknown_categories', 'cache_hits']
+STATS = None  # Stats while instrumentation is enabled
+NULL_TIMER = nullcontext()
+
+
+class Stats:
+
+    def __init__(self):
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.unknown_categories = dict()  # feature display name -> values outside its vocabulary
+        self.seconds = dict.fromkeys(PHASES, 0.0)  # wall time, phases may nest (e.g. encode inside a streamed load)
+        self.calls = dict.fromkeys(PHASES, 0)
+        self.lock = threading.Lock()  # hooks may run in scoring threads
+
+    def count(self, name: str, value: int):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def count_unknown(self, feature: str, value: int):
+        with self.lock:
+            self.unknown_categories[feature] = self.unknown_categories.get(feature, 0) + value
+        self.count('unknown_categories', value)
+
+    def add_time(self, phase: str, seconds: float):
+        with self.lock:
+            self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+            self.calls[phase] = self.calls.get(phase, 0) + 1
+
+    def to_dict(self) -> Dict:
+        return {
+            'counters': dict(self.counters),
+            'unknown_categories': dict(self.unknown_categories),
+            'seconds': dict(self.seconds),
+            'calls': dict(self.calls),
+        }
+
+    def to_prometheus(self, prefix: str = 'naive_bayes') -> str:  # text exposition format
+        lines = list()
+        for name, value in self.counters.items():
+            lines.append(f'# TYPE {prefix}_{name}_total counter')
+            lines.append(f'{prefix}_{name}_total {value}')
+        if len(self.unknown_categories) > 0:
+            lines.append(f'# TYPE {prefix}_unknown_categories_by_feature_total counter')
+            for feature, value in self.unknown_categories.items():
+                lines.append(f'{prefix}_unknown_categories_by_feature_total{{feature="{Stats.escape(feature)}"}} {value}')
+        lines.append(f'# TYPE {prefix}_phase_seconds_total counter')
+        for phase, value in self.seconds.items():
+            lines.append(f'{prefix}_phase_seconds_total{{phase="{phase}"}} {value:.9f}')
+        lines.append(f'# TYPE {prefix}_phase_calls_total counter')
+        for phase, value in self.calls.items():
+            lines.append(f'{prefix}_phase_calls_total{{phase="{phase}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def escape(label: str) -> str:
+        return label.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def debug_print(self):
+        for name, value in self.counters.items():
+            print(name.ljust(20, '.'), value)
+        for feature, value in self.unknown_categories.items():
+            print(f'  unknown in {feature}'.ljust(20, '.'), value)
+        for phase in self.seconds:
+            print(f'{phase} time'.ljust(20, '.'), f'{self.seconds[phase]:.4f}s in {self.calls[phase]} calls')
+
+
+class Timer:
+
+    def __init__(self, stats: Stats, phase: str):
+        self.stats = stats
+        self.phase = phase
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        self.stats.add_time(self.phase, time.perf_counter() - self.start)
+        return False
+
+
+def enable() -> Stats:  # starts from zero; worker processes of a pool keep their own (disabled) state
+    global STATS
+    STATS = Stats()
+    return STATS
+
+
+def disable() -> Optional[Stats]:  # returns what was collected
+    global STATS
+    stats = STATS
+    STATS = None
+    return stats
+
+
+def timer(phase: str):
+    return Timer(STATS, phase) if STATS is not None else NULL_TIMER
+
+
+def count(name: str, value: int):
+    if STATS is not None:
+        STATS.count(name, value)
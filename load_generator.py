@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+'''
+    Load generator for server.py - sends rows of a bundled dataset from concurrent connections:
+        python load_generator.py cmc|mushroom|income [--host 127.0.0.1] [--port 8080 | --unix-socket PATH]
+                                 [--concurrency 32] [--requests 200] [--rows-per-request 1] [--seed 0]
+    Prints client-side throughput and latency percentiles, followed by the server's /stats.
+'''
+
+__copyright__ = "Copyright 2020, Piotr Obst"
+
+import argparse
+import asyncio
+import json
+from random import Random
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from datasets import DATASETS
+
+
+class Connection:
+
+    def __init__(self, host: str, port: int, unix_socket: Optional[str]):
+        self.host = host
+        self.port = port
+        self.unix_socket = unix_socket
+        self.reader = None
+        self.writer = None
+
+    async def open(self):
+        if self.unix_socket is not None:
+            self.reader, self.writer = await asyncio.open_unix_connection(self.unix_socket)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method: str, path: str, body: bytes = b'') -> Tuple[int, Dict]:
+        self.writer.write(f'{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n'
+                          f'Content-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            if key.strip().lower() == 'content-length':
+                length = int(value)
+        return (status, json.loads(await self.reader.readexactly(length)))
+
+    def close(self):
+        self.writer.close()
+
+
+async def worker(connection: Connection, bodies: List[bytes], latencies: List[float]) -> int:
+    errors = 0
+    await connection.open()
+    for body in bodies:
+        start = time.perf_counter()
+        status, _ = await connection.request('POST', '/predict', body)
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            errors += 1
+    connection.close()
+    return errors
+
+
+async def run(args) -> Dict:
+    dataset_class = DATASETS[args.dataset]
+    rows = [line[:-1] for line in dataset_class.clean(dataset_class.load(seed = args.seed))]
+    random = Random(args.seed)
+    bodies = [[json.dumps({'rows': random.sample(rows, args.rows_per_request)}).encode('utf-8') for _ in range(args.requests)]
+              for _ in range(args.concurrency)]
+    latencies = list()
+    start = time.perf_counter()
+    errors = await asyncio.gather(*[worker(Connection(args.host, args.port, args.unix_socket), worker_bodies, latencies)
+                                    for worker_bodies in bodies])
+    elapsed = time.perf_counter() - start
+    milliseconds = np.array(latencies) * 1000
+    result = {
+        'requests': len(latencies),
+        'rows': len(latencies) * args.rows_per_request,
+        'errors': int(sum(errors)),
+        'seconds': elapsed,
+        'requests_per_second': len(latencies) / elapsed,
+        'rows_per_second': len(latencies) * args.rows_per_request / elapsed,
+    }
+    for percentile in [50, 90, 95, 99]:
+        result[f'latency_p{percentile}_ms'] = float(np.percentile(milliseconds, percentile))
+    connection = Connection(args.host, args.port, args.unix_socket)
+    await connection.open()
+    result['server'] = (await connection.request('GET', '/stats'))[1]
+    connection.close()
+    return result
+
+
+def main(arguments: List[str]):
+    parser = argparse.ArgumentParser(description = 'Send concurrent prediction requests to server.py.')
+    parser.add_argument('dataset', choices = list(DATASETS.keys()), help = 'rows are taken from this bundled dataset')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8080)
+    parser.add_argument('--unix-socket')
+    parser.add_argument('--concurrency', type = int, default = 32)
+    parser.add_argument('--requests', type = int, default = 200, help = 'requests per connection')
+    parser.add_argument('--rows-per-request', type = int, default = 1)
+    parser.add_argument('--seed', type = int, default = 0)
+    args = parser.parse_args(arguments)
+    print(json.dumps(asyncio.run(run(args)), indent = 2))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
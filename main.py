@@ -6,14 +6,22 @@ import sys
 from typing import List, Tuple
 
 from cmc import CMC
+from dataset_cache import DatasetCache
 from income import Income
 from naive_bayes import Feature, NaiveBayes, set_verbosity
 from mushroom import Mushroom
 
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1 and sys.argv[1] == '-v':
+    if '-v' in sys.argv[1:]:
         set_verbosity(True)
-    CMC.execute()
-    Mushroom.execute()  # very well trained - almost always correct results. Probably because of a very predictable dataset
-    Income.execute()
+    plot = '--no-plot' not in sys.argv[1:]  # headless: only print the AUC, matplotlib is never imported
+    cache = DatasetCache() if '--no-cache' not in sys.argv[1:] else None  # cleaned, encoded datasets are kept in .dataset_cache
+    for name, execute in [("cmc", CMC.execute), ("mushroom", Mushroom.execute), ("income", Income.execute)]:
+        # mushroom is very well trained - almost always correct results. Probably because of a very predictable dataset
+        roc = execute(plot, cache)
+        if not plot:
+            print(f'{name} AUC: {roc.auc:.4f}')
+    if '--multiclass' in sys.argv[1:]:
+        print("cmc, three contraceptive methods:")
+        CMC.evaluate_multiclass().debug_print()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+__copyright__ = "Copyright 2020, Piotr Obst"
+
+import json
+import struct
+from typing import Dict, Optional
+
+import numpy as np
+
+from naive_bayes import Feature, GaussianFeature, HashedFeature, HistogramFeature, NaiveBayes
+
+
+MAGIC = b'NBMODEL\0'
+VERSION = 1
+ALIGNMENT = 64  # every table starts at a multiple of this many bytes
+FEATURE_KINDS = {'categorical': Feature, 'histogram': HistogramFeature, 'gaussian': GaussianFeature, 'hashed': HashedFeature}
+
+
+class ModelFile:
+    '''
+        Binary layout:
+            8 bytes     magic
+            4 bytes     format version (little-endian uint32)
+            4 bytes     header length (little-endian uint32)
+            header      UTF-8 JSON: responses, features with their categories, table offsets/shapes/dtypes
+            padding     up to ALIGNMENT
+            tables      raw little-endian count (or per-response statistics) arrays, each aligned to ALIGNMENT
+    '''
+
+    @staticmethod
+    def align(offset: int) -> int:
+        return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+    @staticmethod
+    def save(nb: NaiveBayes, filename: str):
+        arrays = list()  # stored in this order
+
+        def describe(array: np.ndarray) -> Dict:
+            arrays.append(np.ascontiguousarray(array, dtype = array.dtype.newbyteorder('<')))
+            return {'index': len(arrays) - 1, 'shape': list(array.shape), 'dtype': arrays[-1].dtype.str}
+
+        header = {
+            'offsets': list(),
+            'responses': list(nb.responses.keys()),
+            'num_of_entries': int(nb.num_of_entries),
+            'total_entries_per_response': describe(nb.total_entries_per_response),
+            'features': list(),
+        }
+        for feature in nb.features:
+            state, feature_arrays = feature.get_state()
+            state['arrays'] = [describe(array) for array in feature_arrays]
+            header['features'].append(state)
+
+        offset = 0  # relative to the start of the tables
+        for array in arrays:
+            offset = ModelFile.align(offset)
+            header['offsets'].append(offset)
+            offset += array.nbytes
+        encoded_header = json.dumps(header).encode('utf-8')
+        data_start = ModelFile.align(len(MAGIC) + 8 + len(encoded_header))
+
+        with open(filename, 'wb') as file:
+            file.write(MAGIC)
+            file.write(struct.pack('<II', VERSION, len(encoded_header)))
+            file.write(encoded_header)
+            for array, array_offset in zip(arrays, header['offsets']):
+                file.write(b'\0' * (data_start + array_offset - file.tell()))
+                file.write(array.tobytes())
+
+    @staticmethod
+    def read_header(filename: str) -> Dict:
+        with open(filename, 'rb') as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'{filename} is not a naive Bayes model file')
+            version, header_length = struct.unpack('<II', file.read(8))
+            if version != VERSION:
+                raise ValueError(f'Unsupported model file version {version} in {filename} (expected {VERSION})')
+            header = json.loads(file.read(header_length).decode('utf-8'))
+        header['data_start'] = ModelFile.align(len(MAGIC) + 8 + header_length)
+        return header
+
+    @staticmethod
+    def load(filename: str, mmap_mode: Optional[str] = 'r') -> NaiveBayes:
+        # mmap_mode 'r': read-only tables shared between processes, 'c': copy-on-write (can be trained further),
+        # None: tables are read into memory
+        header = ModelFile.read_header(filename)
+        if mmap_mode is None:
+            buffer = np.fromfile(filename, dtype = np.uint8)
+        else:
+            buffer = np.memmap(filename, dtype = np.uint8, mode = mmap_mode)
+
+        def get_array(description: Dict) -> np.ndarray:
+            dtype = np.dtype(description['dtype'])
+            start = header['data_start'] + header['offsets'][description['index']]
+            count = int(np.prod(description['shape'], dtype = np.int64))
+            return buffer[start:start + count * dtype.itemsize].view(dtype).reshape(description['shape'])
+
+        nb = NaiveBayes()
+        for response in header['responses']:
+            nb.add_response(response)
+        nb.total_entries_per_response = get_array(header['total_entries_per_response'])
+        nb.num_of_entries = header['num_of_entries']
+        for state in header['features']:
+            if state['kind'] not in FEATURE_KINDS:
+                raise ValueError(f'Unknown feature kind \'{state["kind"]}\' in {filename}')
+            arrays = [get_array(description) for description in state['arrays']]
+            nb.add_feature(FEATURE_KINDS[state['kind']].from_state(state, arrays))
+        return nb
+
+
+if __name__ == "__main__":
+    # train one of the bundled datasets on all of its rows and save it: python model_io.py cmc|mushroom|income OUTPUT_FILE
+    import sys
+    from datasets import DATASETS
+    if len(sys.argv) != 3 or sys.argv[1] not in DATASETS:
+        print(f'usage: {sys.argv[0]} {"|".join(DATASETS)} OUTPUT_FILE', file = sys.stderr)
+        sys.exit(2)
+    dataset_class = DATASETS[sys.argv[1]]
+    nb, _, _ = dataset_class.build_model()
+    nb.load_training_dataset(dataset_class.clean(dataset_class.load()))
+    ModelFile.save(nb, sys.argv[2])
@@ -2,18 +2,33 @@
 
 __copyright__ = "Copyright 2020, Piotr Obst"
 
-from copy import deepcopy
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
 import os
-from random import shuffle
-from typing import Dict, List, Tuple
+from random import Random, shuffle
+import threading
+from types import MappingProxyType
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from zlib import crc32
 
-import matplotlib.pyplot as plt
+import numpy as np
+
+from evaluation import Evaluation, RocCurve
+import instrumentation
+from sharding import FileShards
 
 
-FILENAME_COUNTER = 1
-SAVE_TO_FILE = 1  # 0 = display on the screen, don't save; 1 = save to file, don't display
 MAX_NUMBER_LENGTH = 6
+BATCH_SIZE = 4096  # rows encoded and counted at once when loading in batches
 VERBOSE = False
+UNKNOWN_ERROR = 'error'
+UNKNOWN_SKIP = 'skip'
+UNKNOWN_BUCKET = 'bucket'
+UNKNOWN_CODE = -1  # reserved code of categories missing from the vocabulary
+CACHE_SIZE = 4096  # default number of encoded rows kept by PosteriorCache
+HASH_BUCKETS = 1 << 16  # default number of buckets of a HashedFeature
+VARIANCE_SMOOTHING = 1e-9  # GaussianFeature: fraction of the largest variance added to every variance
 
 
 def set_verbosity(value: bool):
@@ -21,31 +36,122 @@ def set_verbosity(value: bool):
     VERBOSE = value
 
 
+def parse_numbers(values: Sequence[str]) -> np.ndarray:  # NaN for values that aren't numbers
+    try:
+        return np.array(values, dtype = np.float64)
+    except ValueError:
+        numbers = np.empty(len(values))
+        for i in range(len(values)):
+            try:
+                numbers[i] = float(values[i])
+            except ValueError:
+                numbers[i] = np.nan
+        return numbers
+
+
 class Feature:
 
-    def __init__(self, display_name: str, num_of_responses: str):
+    NUMERIC = False  # codes are category ids; numeric features need floating point codes
+
+    def __init__(self, display_name: str, num_of_responses: str, unknown_policy: str = UNKNOWN_ERROR):
         self.display_name = display_name
         self.categories = dict()
-        self.matrix = list()
+        self.matrix = np.zeros((0, num_of_responses), dtype = np.int64)  # categories x responses
         self.num_of_responses = num_of_responses
+        self.version = 0  # incremented whenever the categories, policy or counts change, see NaiveBayes.get_state_key
+        self.unknown_policy = None
+        self.set_unknown_policy(unknown_policy)
+
+    def set_unknown_policy(self, unknown_policy: str):
+        # UNKNOWN_ERROR: raise KeyError, UNKNOWN_SKIP: the feature is ignored for that row,
+        # UNKNOWN_BUCKET: counted and scored as one extra category kept in the last row of the matrix
+        if unknown_policy not in (UNKNOWN_ERROR, UNKNOWN_SKIP, UNKNOWN_BUCKET):
+            raise ValueError(f'Unknown category policy \'{unknown_policy}\' in feature: {self.display_name}')
+        if self.unknown_policy == UNKNOWN_BUCKET and unknown_policy != UNKNOWN_BUCKET:
+            self.matrix = self.matrix[:-1]
+        elif self.unknown_policy != UNKNOWN_BUCKET and unknown_policy == UNKNOWN_BUCKET:
+            self.matrix = np.vstack((self.matrix, np.zeros((1, self.num_of_responses), dtype = np.int64)))
+        self.unknown_policy = unknown_policy
+        self.version += 1
 
     def add_category(self, key: str):
-        if key in self.categories:
+        self.add_categories([key])
+
+    def add_categories(self, keys: Iterable[str]):  # the table is reallocated once for all new keys, not once per key
+        new_keys = [key for key in dict.fromkeys(keys) if key not in self.categories]
+        if len(new_keys) == 0:
             return
-        self.categories[key] = len(self.categories)
-        line = list()
-        for _ in range(self.num_of_responses):
-            line.append(0)
-        self.matrix.append(line)
+        num_of_known = len(self.categories)
+        for key in new_keys:
+            self.categories[key] = len(self.categories)
+        new_rows = np.zeros((len(new_keys), self.num_of_responses), dtype = self.matrix.dtype)
+        self.matrix = np.concatenate((self.matrix[:num_of_known], new_rows, self.matrix[num_of_known:]))  # in front of the unknown bucket, if any
+        self.version += 1
 
-    def get_category_id(self, key: str) -> int:
+    def get_category_id(self, key: str) -> int:  # UNKNOWN_CODE for unknown keys unless the policy is UNKNOWN_ERROR
         if key not in self.categories:
-            print(self.display_name, ' ', key)
-            raise KeyError(f'Unknown key \'{key}\' in feature: {self.display_name}')
+            if self.unknown_policy == UNKNOWN_ERROR:
+                raise KeyError(f'Unknown key \'{key}\' in feature: {self.display_name}')
+            return UNKNOWN_CODE
         return self.categories[key]
 
-    def add_entry(self, category: str, response_id: int):
-        self.matrix[self.get_category_id(category)][response_id] += 1
+    def encode(self, values: Sequence[str]) -> np.ndarray:
+        codes = np.fromiter(map(self.categories.get, values, repeat(UNKNOWN_CODE)), dtype = np.int32, count = len(values))
+        if self.unknown_policy == UNKNOWN_ERROR and (codes == UNKNOWN_CODE).any():
+            self.get_category_id(values[int(np.argmax(codes == UNKNOWN_CODE))])  # raises
+        if instrumentation.STATS is not None and (codes == UNKNOWN_CODE).any():
+            instrumentation.STATS.count_unknown(self.display_name, int((codes == UNKNOWN_CODE).sum()))
+        return codes
+
+    def get_row_ids(self, codes: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:  # (matrix rows, mask of known categories or None)
+        codes = codes.astype(np.intp)
+        if self.unknown_policy == UNKNOWN_BUCKET:
+            return (np.where(codes == UNKNOWN_CODE, len(self.matrix) - 1, codes), None)
+        if self.unknown_policy == UNKNOWN_SKIP:
+            known = codes != UNKNOWN_CODE
+            if not known.all():
+                return (np.where(known, codes, 0), known)
+        return (codes, None)
+
+    def encode_value(self, value: str) -> int:  # encode() of a single value, without the arrays
+        code = self.get_category_id(value)
+        if code == UNKNOWN_CODE and instrumentation.STATS is not None:
+            instrumentation.STATS.count_unknown(self.display_name, 1)
+        return code
+
+    def add_code(self, code: int, response_id: int, weight: int = 1):  # counts one encoded value, nothing is checked
+        if code == UNKNOWN_CODE:
+            if self.unknown_policy != UNKNOWN_BUCKET:
+                return
+            code = len(self.matrix) - 1
+        self.matrix[code, response_id] += weight
+        self.version += 1
+
+    def add_entry(self, category: str, response_id: int, weight: int = 1):
+        self.add_code(self.encode_value(category), response_id, weight)
+
+    def count_entries(self, codes: np.ndarray, response_ids: np.ndarray, weights: Optional[np.ndarray] = None) -> np.ndarray:
+        row_ids, known = self.get_row_ids(codes)
+        if known is not None:
+            weights = known.astype(np.int64) if weights is None else weights * known
+        counts = np.bincount(row_ids * self.num_of_responses + response_ids, weights, minlength = self.matrix.size)
+        return counts.astype(np.int64).reshape(self.matrix.shape)
+
+    def add_entries(self, codes: np.ndarray, response_ids: np.ndarray, weights: Optional[np.ndarray] = None):
+        self.add_counts(self.count_entries(codes, response_ids, weights))
+
+    def check_counts(self, counts: np.ndarray) -> bool:  # whether counts can be added without any becoming negative
+        return not (self.matrix + counts < 0).any()
+
+    def add_counts(self, counts: np.ndarray):  # counts from count_entries or the matrix of a compatible feature
+        self.matrix += counts
+        self.version += 1
+
+    def clone_untrained(self) -> 'Feature':  # same categories and policy, zero counts
+        feature = Feature(self.display_name, self.num_of_responses, self.unknown_policy)
+        feature.categories = dict(self.categories)
+        feature.matrix = np.zeros_like(self.matrix)
+        return feature
 
     def debug_print(self, responses: Dict[str, int] = None):
         print('Feature: ', self.display_name)
@@ -56,15 +162,339 @@ class Feature:
             else:
                 print(list(responses.keys())[i].ljust(MAX_NUMBER_LENGTH), end = '')
         print()
-        for key in self.categories:
-            id = self.categories[key]
+        rows = list(self.categories.items())
+        if self.unknown_policy == UNKNOWN_BUCKET:
+            rows.append(('(unknown)', len(self.matrix) - 1))
+        for key, id in rows:
             print(key.ljust(20, '.'), end = '')
             for i in range(self.num_of_responses):
                 print(str(self.matrix[id][i]).ljust(MAX_NUMBER_LENGTH), end = '')
             print()
 
     def get_category_probability(self, category: str, response_number: int, response_entries: int) -> float:
-        return self.matrix[self.get_category_id(category)][response_number] / response_entries
+        row_ids, known = self.get_row_ids(np.array([self.get_category_id(category)]))
+        if known is not None:
+            return 1.0  # skipped
+        return float(self.matrix[row_ids[0], response_number] / response_entries)
+
+    def get_state(self) -> Tuple[Dict, List[np.ndarray]]:  # used by model_io
+        state = {'kind': 'categorical', 'display_name': self.display_name, 'categories': list(self.categories.keys()), 'unknown_policy': self.unknown_policy}
+        return (state, [self.matrix])
+
+    @staticmethod
+    def from_state(state: Dict, arrays: List[np.ndarray]) -> 'Feature':
+        feature = Feature(state['display_name'], arrays[0].shape[1])
+        feature.unknown_policy = state.get('unknown_policy', UNKNOWN_ERROR)  # matrix already includes the bucket row
+        feature.categories = {key: i for i, key in enumerate(state['categories'])}
+        feature.matrix = arrays[0]
+        return feature
+
+    def get_likelihood_table(self, total_entries_per_response: np.ndarray) -> np.ndarray:  # matrix rows x responses, P(category | response)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            return np.where(total_entries_per_response != 0, self.matrix / total_entries_per_response, 0.0)
+
+    def get_likelihoods(self, codes: np.ndarray, total_entries_per_response: np.ndarray,
+                        table: Optional[np.ndarray] = None) -> np.ndarray:  # rows x responses; table: from get_likelihood_table
+        ratios = table if table is not None else self.get_likelihood_table(total_entries_per_response)
+        row_ids, known = self.get_row_ids(codes)
+        likelihoods = ratios[row_ids]
+        if known is not None:
+            likelihoods[~known] = 1.0
+        return likelihoods
+
+    def get_value_likelihoods(self, code: int, table: np.ndarray) -> Optional[np.ndarray]:  # one encoded value, None if it is skipped
+        if code == UNKNOWN_CODE:
+            return table[-1] if self.unknown_policy == UNKNOWN_BUCKET else None
+        return table[code]
+
+    def get_log_likelihoods(self, total_entries_per_response: np.ndarray, smoothing: float) -> np.ndarray:  # matrix rows x responses
+        # Lidstone smoothing: (count + alpha) / (total + alpha * categories); alpha = 1 is Laplace
+        denominators = total_entries_per_response + smoothing * len(self.matrix)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            log_likelihoods = np.log(self.matrix + smoothing) - np.log(denominators)
+        return np.where(denominators > 0, log_likelihoods, -np.inf)
+
+
+class HistogramFeature(Feature):  # numeric values counted in fixed bins, category i holds edges[i - 1] <= value < edges[i]
+
+    def __init__(self, display_name: str, num_of_responses: int, edges: Sequence[float], unknown_policy: str = UNKNOWN_ERROR):
+        super().__init__(display_name, num_of_responses, unknown_policy)
+        self.edges = np.array(edges, dtype = np.float64)
+        self.add_categories([str(i) for i in range(len(self.edges) + 1)])
+
+    def encode(self, values: Sequence[str]) -> np.ndarray:  # values that aren't numbers are unknown categories
+        numbers = parse_numbers(values)
+        codes = np.searchsorted(self.edges, numbers, side = 'right').astype(np.int32)
+        unknown = np.isnan(numbers)
+        if unknown.any():
+            if self.unknown_policy == UNKNOWN_ERROR:
+                raise KeyError(f'Not a number \'{values[int(np.argmax(unknown))]}\' in feature: {self.display_name}')
+            codes[unknown] = UNKNOWN_CODE
+            if instrumentation.STATS is not None:
+                instrumentation.STATS.count_unknown(self.display_name, int(unknown.sum()))
+        return codes
+
+    def encode_value(self, value: str) -> int:
+        return int(self.encode([value])[0])
+
+    def clone_untrained(self) -> 'HistogramFeature':
+        feature = HistogramFeature(self.display_name, self.num_of_responses, self.edges, self.unknown_policy)
+        feature.matrix = np.zeros_like(self.matrix)
+        return feature
+
+    def get_state(self) -> Tuple[Dict, List[np.ndarray]]:
+        state, arrays = super().get_state()
+        state['kind'] = 'histogram'
+        state['edges'] = self.edges.tolist()
+        return (state, arrays)
+
+    @staticmethod
+    def from_state(state: Dict, arrays: List[np.ndarray]) -> 'HistogramFeature':
+        feature = HistogramFeature(state['display_name'], arrays[0].shape[1], state['edges'])
+        feature.unknown_policy = state.get('unknown_policy', UNKNOWN_ERROR)
+        feature.matrix = arrays[0]
+        return feature
+
+
+class HashedFeature(Feature):
+    '''
+        Categorical values of unbounded cardinality (e.g. zip codes), counted in a fixed number of buckets: crc32(value) % num_of_buckets.
+        There is no vocabulary, so every value has a bucket and none is unknown; values sharing a bucket share its counts.
+        crc32 doesn't depend on the process (unlike hash()), so shards, saved models and the cache agree on the buckets.
+    '''
+
+    def __init__(self, display_name: str, num_of_responses: int, num_of_buckets: int = HASH_BUCKETS):
+        if num_of_buckets < 1 or num_of_buckets > np.iinfo(np.int32).max:
+            raise ValueError(f'Number of buckets must be between 1 and {np.iinfo(np.int32).max} in feature: {display_name}')
+        super().__init__(display_name, num_of_responses, UNKNOWN_SKIP)
+        self.num_of_buckets = num_of_buckets
+        self.matrix = np.zeros((num_of_buckets, num_of_responses), dtype = np.int64)
+
+    def set_unknown_policy(self, unknown_policy: str):  # accepted for compatibility, hashed values are never unknown
+        if unknown_policy not in (UNKNOWN_ERROR, UNKNOWN_SKIP, UNKNOWN_BUCKET):
+            raise ValueError(f'Unknown category policy \'{unknown_policy}\' in feature: {self.display_name}')
+        self.unknown_policy = UNKNOWN_SKIP
+
+    def add_categories(self, keys: Iterable[str]):
+        raise ValueError(f'Categories can\'t be added to hashed feature: {self.display_name}')
+
+    def get_category_id(self, key: str) -> int:
+        return crc32(key.encode('utf-8')) % self.num_of_buckets
+
+    def encode(self, values: Sequence[str]) -> np.ndarray:
+        hashes = np.fromiter(map(crc32, map(str.encode, values)), dtype = np.uint32, count = len(values))
+        return (hashes % self.num_of_buckets).astype(np.int32)
+
+    def clone_untrained(self) -> 'HashedFeature':
+        return HashedFeature(self.display_name, self.num_of_responses, self.num_of_buckets)
+
+    def debug_print(self, responses: Dict[str, int] = None):
+        print('Feature: ', self.display_name, f'({self.num_of_buckets} hashed buckets, empty ones not shown)')
+        names = list(responses.keys()) if responses is not None else [str(i) for i in range(self.num_of_responses)]
+        print(' ' * 20 + ''.join(name.ljust(MAX_NUMBER_LENGTH) for name in names))
+        for bucket in np.flatnonzero(self.matrix.any(axis = 1)):
+            print(f'#{bucket}'.ljust(20, '.') + ''.join(str(count).ljust(MAX_NUMBER_LENGTH) for count in self.matrix[bucket]))
+
+    def get_state(self) -> Tuple[Dict, List[np.ndarray]]:
+        return ({'kind': 'hashed', 'display_name': self.display_name, 'num_of_buckets': self.num_of_buckets}, [self.matrix])
+
+    @staticmethod
+    def from_state(state: Dict, arrays: List[np.ndarray]) -> 'HashedFeature':
+        feature = HashedFeature(state['display_name'], arrays[0].shape[1], state['num_of_buckets'])
+        feature.matrix = arrays[0]
+        return feature
+
+
+class GaussianFeature:
+    '''
+        Numeric values modelled by one normal distribution per response.
+        matrix rows are the streaming sufficient statistics per response: count, mean and M2 (sum of squared deviations);
+        batches are combined with Chan's parallel update, which also works for negative weights (subtracting rows).
+        The result depends on the batch boundaries within rounding error, so fit_file or merged shards aren't bit-identical to serial training.
+        Values that aren't numbers raise under UNKNOWN_ERROR, otherwise they are skipped (UNKNOWN_BUCKET behaves like UNKNOWN_SKIP).
+    '''
+
+    NUMERIC = True
+
+    def __init__(self, display_name: str, num_of_responses: int, unknown_policy: str = UNKNOWN_ERROR, variance_smoothing: float = VARIANCE_SMOOTHING):
+        self.display_name = display_name
+        self.categories = dict()  # no vocabulary
+        self.matrix = np.zeros((3, num_of_responses))  # count, mean, M2 x responses
+        self.num_of_responses = num_of_responses
+        self.variance_smoothing = variance_smoothing
+        self.version = 0  # incremented whenever the statistics change, see NaiveBayes.get_state_key
+        self.unknown_policy = None
+        self.set_unknown_policy(unknown_policy)
+
+    def set_unknown_policy(self, unknown_policy: str):
+        if unknown_policy not in (UNKNOWN_ERROR, UNKNOWN_SKIP, UNKNOWN_BUCKET):
+            raise ValueError(f'Unknown category policy \'{unknown_policy}\' in feature: {self.display_name}')
+        self.unknown_policy = unknown_policy
+        self.version += 1
+
+    def encode(self, values: Sequence[str]) -> np.ndarray:  # the values themselves, NaN where missing
+        numbers = parse_numbers(values)
+        unknown = np.isnan(numbers)
+        if unknown.any():
+            if self.unknown_policy == UNKNOWN_ERROR:
+                raise ValueError(f'Not a number \'{values[int(np.argmax(unknown))]}\' in feature: {self.display_name}')
+            if instrumentation.STATS is not None:
+                instrumentation.STATS.count_unknown(self.display_name, int(unknown.sum()))
+        return numbers
+
+    def encode_value(self, value: str) -> float:
+        return float(self.encode([value])[0])
+
+    def add_code(self, value: float, response_id: int, weight: int = 1):  # the update of add_counts for a single value
+        if np.isnan(value):
+            return
+        count_a, mean_a, m2_a = self.matrix[:, response_id]
+        count = count_a + weight
+        if count == 0:
+            self.matrix[:, response_id] = 0.0
+        else:
+            delta = value - mean_a
+            self.matrix[:, response_id] = (count, mean_a + delta * weight / count, max(m2_a + delta ** 2 * count_a * weight / count, 0.0))
+        self.version += 1
+
+    def add_entry(self, value: str, response_id: int, weight: int = 1):
+        self.add_code(self.encode_value(value), response_id, weight)
+
+    def count_entries(self, codes: np.ndarray, response_ids: np.ndarray, weights: Optional[np.ndarray] = None) -> np.ndarray:
+        values = codes.astype(np.float64)
+        known = ~np.isnan(values)
+        weights = known.astype(np.float64) if weights is None else weights * known
+        values = np.where(known, values, 0.0)
+        counts = np.bincount(response_ids, weights, minlength = self.num_of_responses)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            means = np.where(counts != 0, np.bincount(response_ids, weights * values, minlength = self.num_of_responses) / counts, 0.0)
+        m2 = np.bincount(response_ids, weights * (values - means[response_ids]) ** 2, minlength = self.num_of_responses)
+        return np.vstack((counts, means, m2))
+
+    def add_entries(self, codes: np.ndarray, response_ids: np.ndarray, weights: Optional[np.ndarray] = None):
+        self.add_counts(self.count_entries(codes, response_ids, weights))
+
+    def check_counts(self, counts: np.ndarray) -> bool:
+        return not (self.matrix[0] + counts[0] < 0).any()
+
+    def add_counts(self, counts: np.ndarray):  # Chan et al.: combines (count, mean, M2) of two sets of rows
+        count_a, mean_a, m2_a = self.matrix
+        count_b, mean_b, m2_b = counts
+        count = count_a + count_b
+        delta = mean_b - mean_a
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            mean = np.where(count != 0, mean_a + delta * count_b / count, 0.0)
+            m2 = np.where(count != 0, m2_a + m2_b + delta ** 2 * count_a * count_b / count, 0.0)
+        # in place, like the count tables: a read-only (memory-mapped) matrix raises instead of being replaced
+        self.matrix[...] = np.vstack((count, mean, np.maximum(m2, 0.0)))  # rounding may leave a tiny negative M2 after subtracting
+        self.version += 1
+
+    def get_variances(self) -> np.ndarray:
+        counts, _, m2 = self.matrix
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            variances = np.where(counts > 0, m2 / counts, 0.0)
+        largest = variances.max() if len(variances) > 0 else 0.0
+        return variances + self.variance_smoothing * (largest if largest > 0 else 1.0)
+
+    def get_likelihood_table(self, total_entries_per_response: np.ndarray) -> np.ndarray:  # means, variances, log normalizers x responses
+        variances = self.get_variances()
+        with np.errstate(divide = 'ignore'):
+            log_norms = np.where(self.matrix[0] > 0, -0.5 * np.log(2 * np.pi * variances), -np.inf)
+        return np.vstack((self.matrix[1], variances, log_norms))
+
+    def get_log_densities(self, values: np.ndarray, table: Optional[np.ndarray] = None) -> np.ndarray:  # rows x responses, 0 for missing values
+        means, variances, log_norms = table if table is not None else self.get_likelihood_table(None)
+        values = values.astype(np.float64)[:, np.newaxis]
+        densities = log_norms - (values - means) ** 2 / (2 * variances)
+        densities[np.isnan(values[:, 0])] = 0.0
+        return densities
+
+    def get_likelihoods(self, codes: np.ndarray, total_entries_per_response: np.ndarray,
+                        table: Optional[np.ndarray] = None) -> np.ndarray:  # rows x responses
+        return np.exp(self.get_log_densities(codes, table))
+
+    def get_value_likelihoods(self, value: float, table: np.ndarray) -> Optional[np.ndarray]:
+        if np.isnan(value):
+            return None
+        means, variances, log_norms = table
+        return np.exp(log_norms - (value - means) ** 2 / (2 * variances))
+
+    def clone_untrained(self) -> 'GaussianFeature':
+        return GaussianFeature(self.display_name, self.num_of_responses, self.unknown_policy, self.variance_smoothing)
+
+    def debug_print(self, responses: Dict[str, int] = None):
+        print('Feature: ', self.display_name, '(gaussian)')
+        names = list(responses.keys()) if responses is not None else [str(i) for i in range(self.num_of_responses)]
+        deviations = np.sqrt(self.get_variances())
+        for i in range(self.num_of_responses):
+            print(names[i].ljust(20, '.'), f'count {int(self.matrix[0][i])}, mean {self.matrix[1][i]:.4f}, std {deviations[i]:.4f}')
+
+    def get_state(self) -> Tuple[Dict, List[np.ndarray]]:
+        state = {'kind': 'gaussian', 'display_name': self.display_name, 'unknown_policy': self.unknown_policy, 'variance_smoothing': self.variance_smoothing}
+        return (state, [self.matrix])
+
+    @staticmethod
+    def from_state(state: Dict, arrays: List[np.ndarray]) -> 'GaussianFeature':
+        feature = GaussianFeature(state['display_name'], arrays[0].shape[1], state.get('unknown_policy', UNKNOWN_ERROR),
+                                  state.get('variance_smoothing', VARIANCE_SMOOTHING))
+        feature.matrix = arrays[0]
+        return feature
+
+
+class PosteriorCache:  # bounded LRU of normalized probabilities, keyed on the bytes of an encoded row
+
+    def __init__(self, max_size: int = CACHE_SIZE):
+        if max_size < 1:
+            raise ValueError(f'Cache size must be positive, got {max_size}')
+        self.max_size = max_size
+        self.entries = OrderedDict()  # least recently used first
+        self.version = None  # model version (NaiveBayes: its state key) the entries were computed for
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()  # models may be shared between threads; rows are scored outside of it
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def lookup(self, codes: np.ndarray, version, compute) -> np.ndarray:  # compute(codes) scores the rows that are not cached
+        if len(codes) == 0:
+            return compute(codes)
+        codes = np.ascontiguousarray(codes)
+        # one bytes key per row; the dtype is part of the key as the same row may come encoded with a different one
+        key_prefix = codes.dtype.str.encode('ascii')
+        keys = [key_prefix + key for key in codes.view(np.dtype((np.void, codes.dtype.itemsize * codes.shape[1]))).ravel().tolist()]
+        with self.lock:
+            if version != self.version:  # the counts changed since the entries were stored
+                self.entries.clear()
+                self.version = version
+            rows = list(map(self.entries.get, keys))
+            missing = dict()  # key -> indices of rows with that key, duplicated rows are scored once
+            for i in range(len(rows)):
+                if rows[i] is None:
+                    missing.setdefault(keys[i], list()).append(i)
+                else:
+                    self.entries.move_to_end(keys[i])
+            self.hits += len(codes) - len(missing)
+            self.misses += len(missing)
+        instrumentation.count('cache_hits', len(codes) - len(missing))
+        if len(missing) > 0:
+            computed = compute(codes[[indices[0] for indices in missing.values()]])
+            with self.lock:
+                for (key, indices), probabilities in zip(missing.items(), computed):
+                    probabilities.flags.writeable = False  # shared between callers
+                    if self.version == version:
+                        self.entries[key] = probabilities
+                    for i in indices:
+                        rows[i] = probabilities
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last = False)
+        return np.array(rows)
+
+    def get_stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {'size': len(self.entries), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups > 0 else 0.0}
 
 
 class NaiveBayes:
@@ -72,53 +502,268 @@ class NaiveBayes:
     def __init__(self):
         self.features = list()
         self.responses = dict()
-        self.total_entries_per_response = list()
+        self.total_entries_per_response = np.zeros(0, dtype = np.int64)
         self.num_of_entries = 0
+        self.version = 0  # incremented whenever counts or structure change, invalidates the cache
+        self.cache = None  # PosteriorCache, see enable_cache
+        self.likelihood_tables = (None, list())  # (state key, table of every feature), see get_likelihood_tables
+
+    def enable_cache(self, max_size: int = CACHE_SIZE) -> PosteriorCache:
+        self.cache = PosteriorCache(max_size)
+        return self.cache
+
+    def disable_cache(self):
+        self.cache = None
 
     def add_feature(self, feature: Feature):
         self.features.append(feature)
+        self.version += 1
 
     def add_response(self, key: str):
         if key in self.responses:
             return
         self.responses[key] = len(self.responses)
-        self.total_entries_per_response.append(0)
+        self.total_entries_per_response = np.append(self.total_entries_per_response, np.int64(0))
+        self.version += 1
+
+    def load_training_dataset(self, dataset: Iterable[List], weights: Optional[Sequence[int]] = None):
+        # rows, or batches of rows such as Util.iter_file yields; weights: integer count of every row (e.g. of duplicates), default 1
+        start = 0
+        for batch in NaiveBayes.iter_batches(dataset):
+            self.load_batch(batch, 1 if weights is None else np.asarray(weights[start:start + len(batch)]))
+            start += len(batch)
 
-    def load_training_dataset(self, dataset: List[List[str]]):
-        for line in dataset:
-            self.load_line(line)
+    def fit_file(self, filename: str, class_attribute_index: int, delimiter: str, n_workers: Optional[int] = None,
+                 pipeline = None) -> 'NaiveBayes':  # pipeline: preprocessing.Pipeline cleaning the parsed lines, must be picklable
+        # map-reduce: the file is split into byte ranges, each worker parses and counts one of them into its own count arrays
+        # and the arrays are added into this model; integer counts make the result identical to serial training, the floating point
+        # statistics of a GaussianFeature are merged in a different order and may differ from it in the last bits
+        if n_workers is None or n_workers < 1:
+            n_workers = os.cpu_count()
+        shards = FileShards.split(filename, n_workers)
+        template = self.clone_untrained()
+        if n_workers == 1:
+            partial_models = [Util.fit_shard(template, filename, start, end, class_attribute_index, delimiter, pipeline) for start, end in shards]
+        else:
+            with ProcessPoolExecutor(max_workers = n_workers) as executor:
+                futures = [executor.submit(Util.fit_shard, template, filename, start, end, class_attribute_index, delimiter, pipeline)
+                           for start, end in shards]
+                partial_models = [future.result() for future in futures]
+        for partial_model in partial_models:
+            self.merge(partial_model)
+        return self
+
+    def partial_fit(self, dataset: Iterable[List]):  # keep training an already trained model
+        self.load_training_dataset(dataset)
+
+    def subtract(self, dataset: Iterable[List]):  # forget rows that were trained before, e.g. for a sliding window
+        for batch in NaiveBayes.iter_batches(dataset):
+            self.load_batch(batch, weight = -1)
+
+    def merge(self, other: 'NaiveBayes'):  # counts are additive, so models trained on separate shards can be combined
+        self.check_compatible(other)
+        self.add_counts([feature.matrix for feature in other.features], other.total_entries_per_response)
+
+    def check_compatible(self, other: 'NaiveBayes'):
+        if self.responses != other.responses:
+            raise ValueError(f'Responses differ: {list(self.responses)} != {list(other.responses)}')
+        if len(self.features) != len(other.features):
+            raise ValueError(f'Number of features differs: {len(self.features)} != {len(other.features)}')
+        for feature, other_feature in zip(self.features, other.features):
+            # the state without the counts covers kind, name, categories, policy, edges, buckets and variance smoothing
+            state, other_state = feature.get_state()[0], other_feature.get_state()[0]
+            if type(feature) is not type(other_feature) or state != other_state or feature.matrix.shape != other_feature.matrix.shape:
+                differences = sorted(key for key in state.keys() | other_state.keys() if state.get(key) != other_state.get(key))
+                raise ValueError(f'Feature \'{feature.display_name}\' differs from \'{other_feature.display_name}\'' +
+                                 (f' in {", ".join(differences)}' if differences else ''))
+
+    @staticmethod
+    def iter_batches(dataset: Iterable[List]) -> Iterator[List[List[str]]]:
+        batch = list()
+        for item in dataset:
+            if len(item) == 0:  # e.g. a batch whose rows were all filtered out by Pipeline.stream
+                continue
+            if isinstance(item[0], (list, tuple)):  # a batch of rows; values of a row may be numbers
+                yield item
+                continue
+            batch.append(item)
+            if len(batch) == BATCH_SIZE:
+                yield batch
+                batch = list()
+        if len(batch) > 0:
+            yield batch
+
+    def load_batch(self, batch: Sequence[List[str]], weight: Union[int, np.ndarray] = 1):  # one weight for all rows, or one per row
+        if len(batch) == 0:
+            return
+        if isinstance(weight, np.ndarray):
+            weights = weight if weight.dtype.kind in 'iu' else NaiveBayes.check_weights(weight)
+        else:
+            weights = None if weight == 1 else NaiveBayes.check_weights(np.full(len(batch), weight))
+        self.load_encoded(self.encode(batch), self.encode_responses(batch), weights)
+
+    @staticmethod
+    def check_weights(weights: np.ndarray) -> np.ndarray:  # counts are integers, so are the weights
+        if not np.array_equal(weights, np.round(weights)):
+            raise ValueError('Row weights must be whole numbers')
+        return weights.astype(np.int64)
 
     def get_response_id(self, key: str) -> int:
         if key not in self.responses:
             pass  # TODO: raise exception
         return self.responses[key]
 
-    def load_line(self, line: List[str]):
-        response_id = self.get_response_id(line[-1])
+    def set_unknown_policy(self, unknown_policy: str):
+        for feature in self.features:
+            feature.set_unknown_policy(unknown_policy)
+        self.version += 1
+
+    def encode(self, rows: Sequence[List[str]]) -> np.ndarray:  # rows x features matrix of category ids
+        return NaiveBayes.encode_features(self.features, rows)
+
+    @staticmethod
+    def get_code_dtype(features: List[Feature]) -> np.dtype:  # smallest signed type holding every id and UNKNOWN_CODE
+        if any(feature.NUMERIC for feature in features):
+            return np.dtype(np.float64)  # numeric values as they are, category ids are exact in it too
+        return np.result_type(np.int8, *[np.min_scalar_type(-len(feature.matrix)) for feature in features])
+
+    @staticmethod
+    def encode_features(features: List[Feature], rows: Sequence[List[str]]) -> np.ndarray:
+        with instrumentation.timer('encode'):
+            codes = np.empty((len(rows), len(features)), dtype = NaiveBayes.get_code_dtype(features))
+            for i in range(len(features)):
+                codes[:, i] = features[i].encode([row[i] for row in rows])
+        return codes
+
+    def encode_responses(self, dataset: Sequence[List[str]]) -> np.ndarray:  # class attribute is the last element
+        with instrumentation.timer('encode'):
+            return np.fromiter((self.get_response_id(line[-1]) for line in dataset), dtype = np.intp, count = len(dataset))
+
+    def load_encoded(self, codes: np.ndarray, response_ids: np.ndarray, weights: Optional[np.ndarray] = None):
+        with instrumentation.timer('train'):
+            feature_counts = [self.features[i].count_entries(codes[:, i], response_ids, weights) for i in range(len(self.features))]
+            totals = np.bincount(response_ids, weights, minlength = len(self.responses)).astype(np.int64)
+            self.add_counts(feature_counts, totals)
+        if weights is None:
+            instrumentation.count('rows_trained', len(response_ids))
+        elif instrumentation.STATS is not None:  # a row counts as many rows as its weight, subtracted rows are counted apart
+            instrumentation.count('rows_trained', int(weights[weights > 0].sum()))
+            instrumentation.count('rows_forgotten', int(-weights[weights < 0].sum()))
+
+    def add_counts(self, feature_counts: List[np.ndarray], total_entries_per_response: np.ndarray):
+        # all counts are checked before anything is modified, so a failed subtract leaves the model intact
+        self.check_writable()
+        if (self.total_entries_per_response + total_entries_per_response < 0).any() or \
+                not all(self.features[i].check_counts(feature_counts[i]) for i in range(len(self.features))):
+            raise ValueError('Counts would become negative - the rows were not part of the training data')
+        for i in range(len(self.features)):
+            self.features[i].add_counts(feature_counts[i])
+        self.total_entries_per_response += total_entries_per_response
+        self.num_of_entries += int(total_entries_per_response.sum())
+        self.version += 1
+
+    def load_line(self, line: List[str], weight: int = 1):  # weight: the line is counted that many times
+        if weight < 0 or weight != int(weight):  # subtracting or invalid: the batch path checks every count before changing any
+            self.load_batch([line], weight)
+            return
+        with instrumentation.timer('train'):
+            self.check_writable()
+            response_id = self.get_response_id(line[-1])
+            codes = [self.features[i].encode_value(line[i]) for i in range(len(self.features))]  # may raise, nothing is counted yet
+            for feature, code in zip(self.features, codes):
+                feature.add_code(code, response_id, weight)
+            self.total_entries_per_response[response_id] += weight
+            self.num_of_entries += int(weight)
+            self.version += 1
+        instrumentation.count('rows_trained', int(weight))
+
+    def check_writable(self):
+        if not self.total_entries_per_response.flags.writeable or not all(feature.matrix.flags.writeable for feature in self.features):
+            raise ValueError('The model is read-only - load it with ModelFile.load(filename, mmap_mode = \'c\') to train it further')
+
+    def get_state_key(self) -> Tuple:
+        # changes with every change of the model or of one of its features, also when a feature was changed directly
+        # (e.g. feature.add_category after the model was used); keys the likelihood tables and the posterior cache
+        return (self.version, id(self.total_entries_per_response), tuple((feature.version, id(feature.matrix)) for feature in self.features))
+
+    def get_likelihood_tables(self) -> List[np.ndarray]:  # computed from the counts once per state, not on every predict
+        key, tables = self.likelihood_tables
+        if key != self.get_state_key():
+            key = self.get_state_key()
+            tables = [feature.get_likelihood_table(self.total_entries_per_response) for feature in self.features]
+            self.likelihood_tables = (key, tables)  # one assignment, scoring threads see either the old or the new pair
+        return tables
+
+    def get_response_probabilities_encoded(self, codes: np.ndarray) -> np.ndarray:  # not normalized, rows x responses
+        probabilities = np.ones((len(codes), len(self.responses)))
+        tables = self.get_likelihood_tables()
+        for i in range(len(self.features)):
+            probabilities *= self.features[i].get_likelihoods(codes[:, i], self.total_entries_per_response, tables[i])
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            probabilities *= self.total_entries_per_response / self.num_of_entries
+        return probabilities
+
+    def predict_proba_encoded(self, codes: np.ndarray, weights: Optional[np.ndarray] = None) -> np.ndarray:  # normalized, rows x responses
+        # weights: how many rows each code row stands for (compressed duplicates), only used by the rows_predicted counter
+        with instrumentation.timer('predict'):
+            if self.cache is not None:
+                probabilities = self.cache.lookup(codes, self.get_state_key(), self.compute_proba_encoded)
+            else:
+                probabilities = self.compute_proba_encoded(codes)
+        NaiveBayes.count_predicted(len(codes), weights)
+        return probabilities
+
+    @staticmethod
+    def count_predicted(num_of_rows: int, weights: Optional[np.ndarray] = None):
+        if weights is None:
+            instrumentation.count('rows_predicted', num_of_rows)
+        elif instrumentation.STATS is not None:
+            instrumentation.count('rows_predicted', int(weights.sum()))
+
+    def compute_proba_encoded(self, codes: np.ndarray) -> np.ndarray:  # uncached predict_proba_encoded
+        probabilities = self.get_response_probabilities_encoded(codes)
+        sums = probabilities.sum(axis = 1, keepdims = True)
+        np.divide(probabilities, sums, out = probabilities, where = sums != 0)
+        return probabilities
+
+    def predict_proba_batch(self, rows: Sequence[List[str]]) -> np.ndarray:  # normalized, rows x responses
+        return self.predict_proba_encoded(self.encode(rows))
+
+    def get_response_probabilities(self, categories: List[str]) -> np.ndarray:  # not normalized, one row without building arrays of it
+        tables = self.get_likelihood_tables()
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            probabilities = self.total_entries_per_response / self.num_of_entries
         for i in range(len(self.features)):
-            self.features[i].add_entry(line[i], response_id)
-        self.total_entries_per_response[response_id] += 1
-        self.num_of_entries += 1
+            likelihoods = self.features[i].get_value_likelihoods(self.features[i].encode_value(categories[i]), tables[i])
+            if likelihoods is not None:
+                probabilities = probabilities * likelihoods
+        return probabilities
 
     def get_response_probability(self, response: str, categories: List[str]):  # not normalized
-        probability = 1
         response_id = self.get_response_id(response)
-        for i in range(len(self.features)):
-            probability *= self.features[i].get_category_probability(categories[i], response_id, self.total_entries_per_response[response_id])
-        probability *= (self.total_entries_per_response[response_id] / self.num_of_entries)
-        return probability
+        return float(self.get_response_probabilities(categories)[response_id])
 
     def get_probabilities_for_responses(self, categories: List[str]):  # normalized
-        probabilities = list()
-        sum_of_probabilities = 0
+        if self.cache is not None:
+            return self.predict_proba_batch([categories])[0].tolist()
+        with instrumentation.timer('predict'):
+            probabilities = self.get_response_probabilities(categories)
+            total = probabilities.sum()
+            if total != 0:
+                probabilities = probabilities / total
+        instrumentation.count('rows_predicted', 1)
+        return probabilities.tolist()
+
+    def clone_untrained(self) -> 'NaiveBayes':  # copies only the schema: responses, features and their categories
+        nb = NaiveBayes()
         for response in self.responses:
-            probability = self.get_response_probability(response, categories)
-            probabilities.append(probability)
-            sum_of_probabilities += probability
-        if sum_of_probabilities != 0:
-            for i in range(len(probabilities)):  # normalize
-                probabilities[i] /= sum_of_probabilities
-        return probabilities
+            nb.add_response(response)
+        for feature in self.features:
+            nb.add_feature(feature.clone_untrained())
+        return nb
+
+    def freeze(self, smoothing: float = 1.0) -> 'FrozenNaiveBayes':
+        return FrozenNaiveBayes(self, smoothing)
 
     def debug_print(self):
         for feature in self.features:
@@ -130,125 +775,385 @@ class NaiveBayes:
             print()
 
 
+class FrozenNaiveBayes:
+    '''
+        Immutable log-space snapshot of a trained NaiveBayes; later training doesn't affect it.
+        Attributes can't be reassigned and the tables are read-only, so one instance can be shared by any number of threads
+        (the optional posterior cache is internally locked).
+    '''
+
+    __slots__ = ('smoothing', 'responses', 'features', 'table_columns', 'offsets', 'unknown_rows', 'log_table', 'gaussian_columns',
+                 'gaussian_means', 'gaussian_variances', 'gaussian_log_norms', 'log_priors', 'cache')
+
+    def __init__(self, nb: NaiveBayes, smoothing: float = 1.0):
+        totals = nb.total_entries_per_response.astype(np.float64)
+        # one ragged table for all categorical features; offsets[i] is the row of the first category of feature table_columns[i],
+        # unknown_rows[i] the row used for its unknown categories (the bucket, or zeros for skipped ones)
+        tables = list()
+        table_columns = [i for i in range(len(nb.features)) if not isinstance(nb.features[i], GaussianFeature)]
+        for i in table_columns:
+            table = nb.features[i].get_log_likelihoods(totals, smoothing)
+            if nb.features[i].unknown_policy != UNKNOWN_BUCKET:
+                table = np.vstack((table, np.zeros((1, len(nb.responses)))))
+            tables.append(table)
+        offsets = np.cumsum([0] + [len(table) for table in tables])[:-1].astype(np.intp)
+        # gaussian features: columns x responses parameters, scored together
+        gaussian_columns = [i for i in range(len(nb.features)) if isinstance(nb.features[i], GaussianFeature)]
+        gaussian_variances = np.array([nb.features[i].get_variances() for i in gaussian_columns]).reshape(len(gaussian_columns), len(nb.responses))
+        counts = np.array([nb.features[i].matrix[0] for i in gaussian_columns]).reshape(len(gaussian_columns), len(nb.responses))
+        with np.errstate(divide = 'ignore'):
+            gaussian_log_norms = np.where(counts > 0, -0.5 * np.log(2 * np.pi * gaussian_variances), -np.inf)
+        denominator = nb.num_of_entries + smoothing * len(nb.responses)
+        with np.errstate(divide = 'ignore'):
+            log_priors = np.log(totals + smoothing) - np.log(denominator) if denominator > 0 else np.full(len(totals), -np.inf)
+        self.__setstate__({
+            'smoothing': smoothing,
+            'responses': dict(nb.responses),
+            'features': [feature.clone_untrained() for feature in nb.features],  # only used for encoding
+            'table_columns': np.array(table_columns, dtype = np.intp),
+            'offsets': offsets,
+            'unknown_rows': np.array([offset + len(table) - 1 for offset, table in zip(offsets, tables)], dtype = np.intp),
+            'log_table': np.vstack(tables) if len(tables) > 0 else np.zeros((0, len(nb.responses))),
+            'gaussian_columns': np.array(gaussian_columns, dtype = np.intp),
+            'gaussian_means': np.array([nb.features[i].matrix[1] for i in gaussian_columns]).reshape(len(gaussian_columns), len(nb.responses)),
+            'gaussian_variances': gaussian_variances,
+            'gaussian_log_norms': gaussian_log_norms,
+            'log_priors': log_priors,
+        })
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'FrozenNaiveBayes is read-only, can\'t set \'{name}\'')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'FrozenNaiveBayes is read-only, can\'t delete \'{name}\'')
+
+    def __getstate__(self) -> Dict:  # for pickle; the cache isn't kept
+        state = {name: getattr(self, name) for name in FrozenNaiveBayes.__slots__ if name != 'cache'}
+        state['responses'] = dict(state['responses'])
+        return state
+
+    def __setstate__(self, state: Dict):
+        for name in ('table_columns', 'offsets', 'unknown_rows', 'log_table', 'gaussian_columns', 'gaussian_means', 'gaussian_variances',
+                     'gaussian_log_norms', 'log_priors'):
+            state[name] = np.array(state[name])  # own copy, so no writable view of it exists elsewhere
+            state[name].flags.writeable = False
+        state['responses'] = MappingProxyType(dict(state['responses']))
+        state['features'] = tuple(state['features'])
+        state['cache'] = None  # PosteriorCache; never invalidated, the tables don't change
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+
+    def enable_cache(self, max_size: int = CACHE_SIZE) -> PosteriorCache:
+        object.__setattr__(self, 'cache', PosteriorCache(max_size))
+        return self.cache
+
+    def disable_cache(self):
+        object.__setattr__(self, 'cache', None)
+
+    def encode(self, rows: Sequence[List[str]]) -> np.ndarray:
+        return NaiveBayes.encode_features(self.features, rows)
+
+    def get_joint_log_likelihoods(self, codes: np.ndarray) -> np.ndarray:  # rows x responses
+        joint = np.tile(self.log_priors, (len(codes), 1))
+        for i in range(len(self.offsets)):
+            column = codes[:, self.table_columns[i]].astype(np.intp)
+            joint += self.log_table[np.where(column == UNKNOWN_CODE, self.unknown_rows[i], column + self.offsets[i])]
+        if len(self.gaussian_columns) > 0:
+            values = codes[:, self.gaussian_columns].astype(np.float64)[:, :, np.newaxis]  # rows x columns x 1
+            densities = self.gaussian_log_norms - (values - self.gaussian_means) ** 2 / (2 * self.gaussian_variances)
+            densities[np.broadcast_to(np.isnan(values), densities.shape)] = 0.0  # missing values are skipped
+            joint += densities.sum(axis = 1)
+        return joint
+
+    @staticmethod
+    def normalize_log(joint: np.ndarray) -> np.ndarray:
+        maximum = joint.max(axis = 1, keepdims = True)
+        maximum[~np.isfinite(maximum)] = 0
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            return joint - (maximum + np.log(np.exp(joint - maximum).sum(axis = 1, keepdims = True)))  # log-sum-exp
+
+    def predict_log_proba_encoded(self, codes: np.ndarray) -> np.ndarray:
+        with instrumentation.timer('predict'):
+            log_probabilities = FrozenNaiveBayes.normalize_log(self.get_joint_log_likelihoods(codes))
+        instrumentation.count('rows_predicted', len(codes))
+        return log_probabilities
+
+    def predict_proba_encoded(self, codes: np.ndarray, weights: Optional[np.ndarray] = None) -> np.ndarray:  # weights: see NaiveBayes
+        with instrumentation.timer('predict'):
+            if self.cache is not None:
+                probabilities = self.cache.lookup(codes, 0, self.compute_proba_encoded)
+            else:
+                probabilities = self.compute_proba_encoded(codes)
+        NaiveBayes.count_predicted(len(codes), weights)
+        return probabilities
+
+    def compute_proba_encoded(self, codes: np.ndarray) -> np.ndarray:  # uncached predict_proba_encoded
+        probabilities = np.exp(FrozenNaiveBayes.normalize_log(self.get_joint_log_likelihoods(codes)))
+        probabilities[np.isnan(probabilities)] = 0  # all responses impossible (only without smoothing)
+        return probabilities
+
+    def predict_proba_parallel(self, codes: np.ndarray, executor: Optional[Executor] = None, chunk_rows: int = BATCH_SIZE) -> np.ndarray:
+        # chunks of rows are scored by a thread pool; numpy releases the GIL in its kernels, so all cores work on one shared model
+        if executor is None:
+            with ThreadPoolExecutor() as executor:
+                return self.predict_proba_parallel(codes, executor, chunk_rows)
+        probabilities = np.empty((len(codes), len(self.responses)))
+
+        def score(start: int):
+            probabilities[start:start + chunk_rows] = self.predict_proba_encoded(codes[start:start + chunk_rows])
+        for future in [executor.submit(score, start) for start in range(0, len(codes), chunk_rows)]:
+            future.result()
+        return probabilities
+
+    def predict_proba_batch(self, rows: Sequence[List[str]]) -> np.ndarray:
+        return self.predict_proba_encoded(self.encode(rows))
+
+    def get_probabilities_for_responses(self, categories: List[str]):  # normalized
+        return self.predict_proba_batch([categories])[0].tolist()
+
+
+class Fold:
+
+    def __init__(self, start: int, stop: int, feature_counts: List[np.ndarray], total_entries_per_response: np.ndarray,
+                 probabilities: np.ndarray, response_ids: np.ndarray, weights: Optional[np.ndarray] = None):
+        self.start = start  # test rows are dataset[start:stop]
+        self.stop = stop
+        self.feature_counts = feature_counts  # counts of the model trained without the test rows
+        self.total_entries_per_response = total_entries_per_response
+        self.probabilities = probabilities  # test rows x responses
+        self.response_ids = response_ids  # correct responses of the test rows
+        self.weights = weights  # how many rows each test row stands for (compressed duplicates, sample weights), None: 1
+
+    def get_roc(self, positive_id: int, negative_id: int, data_points: int = 100) -> RocCurve:
+        mask = (self.response_ids == positive_id) | (self.response_ids == negative_id)
+        with instrumentation.timer('evaluate'):
+            return RocCurve.from_scores(self.probabilities[mask, positive_id], self.response_ids[mask] == positive_id, data_points,
+                                        self.weights[mask] if self.weights is not None else None)
+
+
+class CrossValidation:
+
+    def __init__(self, model: NaiveBayes, folds: List[Fold]):
+        self.model = model  # trained on the whole dataset
+        self.folds = folds
+
+    def get_fold_rocs(self, positive_id: int, negative_id: int, data_points: int = 100) -> List[RocCurve]:
+        return [fold.get_roc(positive_id, negative_id, data_points) for fold in self.folds]
+
+    def get_roc(self, positive_id: int, negative_id: int, data_points: int = 100) -> RocCurve:  # scores of all folds pooled
+        pooled = Fold(0, 0, list(), np.zeros(0), np.vstack([fold.probabilities for fold in self.folds]),
+                      np.concatenate([fold.response_ids for fold in self.folds]), self.get_pooled_weights())
+        return pooled.get_roc(positive_id, negative_id, data_points)
+
+    def get_pooled_weights(self) -> Optional[np.ndarray]:
+        if all(fold.weights is None for fold in self.folds):
+            return None
+        return np.concatenate([fold.weights if fold.weights is not None else np.ones(len(fold.response_ids), dtype = np.int64) for fold in self.folds])
+
+    def get_evaluation(self, data_points: int = 100) -> Evaluation:  # N-class metrics of all folds pooled
+        probabilities = np.vstack([fold.probabilities for fold in self.folds])
+        response_ids = np.concatenate([fold.response_ids for fold in self.folds])
+        with instrumentation.timer('evaluate'):
+            return Evaluation(probabilities, response_ids, [str(response) for response in self.model.responses], data_points,
+                              self.get_pooled_weights())
+
+
 class Util:
 
     @staticmethod
     def divide_dataset(dataset: List[List[str]], num_of_divisions: int, shift: int) -> Tuple[List[List[str]], List[List[str]]]:  # Tuple(training_dataset, test_dataset)
-        training = list()
-        test = list()
-        min_i = num_of_divisions * shift
-        max_i = len(dataset) / num_of_divisions + min_i
-        for i in range(len(dataset)):
-            if i >= min_i and i < max_i:
-                test.append(dataset[i])
-            else:
-                training.append(dataset[i])
-        return (training, test)
+        start, stop = Util.get_fold_bounds(len(dataset), num_of_divisions, shift)
+        return (dataset[:start] + dataset[stop:], dataset[start:stop])
 
     @staticmethod
-    def load_file(filename: str, class_attribute_index: int, delimiter: str) -> List[List[str]]:
-        dataset = list()
+    def get_fold_bounds(num_of_rows: int, num_of_divisions: int, shift: int) -> Tuple[int, int]:  # test rows are [start, stop)
+        # folds partition the rows; their sizes differ by at most one
+        return (num_of_rows * shift // num_of_divisions, num_of_rows * (shift + 1) // num_of_divisions)
+
+    @staticmethod
+    def get_fold_views(num_of_rows: int, num_of_divisions: int, shift: int) -> Tuple[np.ndarray, slice]:  # (training row indices, test rows)
+        # index-based views over one encoded dataset: codes[test] is a view, codes[training] gathers only when used
+        start, stop = Util.get_fold_bounds(num_of_rows, num_of_divisions, shift)
+        return (np.r_[0:start, stop:num_of_rows], slice(start, stop))
+
+    @staticmethod
+    def parse_line(line: str, class_attribute_index: int, delimiter: str) -> Optional[List[str]]:
+        attributes = line.strip().split(delimiter)  # remove newline char
+        if len(attributes) < 2:  # remove lines without delimiters
+            return None
+        class_attribute = attributes.pop(class_attribute_index)
+        attributes.append(class_attribute)  # class attribute as the last element
+        return attributes
+
+    @staticmethod
+    def iter_file(filename: str, class_attribute_index: int, delimiter: str, batch_size: int = BATCH_SIZE,
+                  shuffle_buffer: int = 0, seed: Optional[int] = None) -> Iterator[List[List[str]]]:
+        # streams the file in batches of parsed lines; shuffle_buffer > 0 shuffles within blocks of that many lines
+        random = Random(seed)
+        block_size = max(shuffle_buffer, batch_size)
+        block = list()
         with open(filename, 'r') as file:
-            lines = file.readlines()
-            for line in lines:
-                dataset_line = list()
-                stripped = line.strip()  # remove newline char
-                attributes = stripped.split(delimiter)
-                if len(attributes) < 2:  # remove lines without delimiters
+            for line in file:
+                dataset_line = Util.parse_line(line, class_attribute_index, delimiter)
+                if dataset_line is None:
                     continue
-                for i in range(len(attributes)):
-                    if i != class_attribute_index:
-                        dataset_line.append(attributes[i])
-                dataset_line.append(attributes[class_attribute_index])  # class attribute as the last element
-                dataset.append(dataset_line)
-        shuffle(dataset)
+                block.append(dataset_line)
+                if len(block) == block_size:
+                    yield from Util.split_block(block, batch_size, random if shuffle_buffer > 0 else None)
+                    block = list()
+        yield from Util.split_block(block, batch_size, random if shuffle_buffer > 0 else None)
+
+    @staticmethod
+    def iter_shard(filename: str, start: int, end: int, class_attribute_index: int, delimiter: str,
+                   batch_size: int = BATCH_SIZE) -> Iterator[List[List[str]]]:  # like iter_file, for the lines starting in [start, end)
+        batch = list()
+        for line in FileShards.iter_lines(filename, start, end):
+            dataset_line = Util.parse_line(line, class_attribute_index, delimiter)
+            if dataset_line is None:
+                continue
+            batch.append(dataset_line)
+            if len(batch) == batch_size:
+                yield batch
+                batch = list()
+        if len(batch) > 0:
+            yield batch
+
+    @staticmethod
+    def fit_shard(template: NaiveBayes, filename: str, start: int, end: int, class_attribute_index: int, delimiter: str,
+                  pipeline = None) -> NaiveBayes:  # counts of one byte range of the file, see NaiveBayes.fit_file
+        model = template.clone_untrained()
+        batches = Util.iter_shard(filename, start, end, class_attribute_index, delimiter)
+        model.load_training_dataset(batches if pipeline is None else pipeline.stream(batches))
+        return model
+
+    @staticmethod
+    def split_block(block: List[List[str]], batch_size: int, random: Optional[Random]) -> Iterator[List[List[str]]]:
+        if random is not None:
+            random.shuffle(block)
+        for i in range(0, len(block), batch_size):
+            yield block[i:i + batch_size]
+
+    @staticmethod
+    def load_file(filename: str, class_attribute_index: int, delimiter: str, seed: Optional[int] = None) -> List[List[str]]:
+        dataset = list()
+        with instrumentation.timer('load'):
+            for batch in Util.iter_file(filename, class_attribute_index, delimiter):
+                dataset.extend(batch)
+            if seed is None:
+                shuffle(dataset)
+            else:
+                Random(seed).shuffle(dataset)
+        instrumentation.count('rows_loaded', len(dataset))
         return dataset
 
     @staticmethod
     def show_plot(plt):
-        global FILENAME_COUNTER
-        plt.plot([0, 1], [0, 1], f"r:", label = f"random classifier")
-        plt.xlabel("False-positives rate")
-        plt.ylabel("True-positives rate")
-        axes = plt.gca()
-        axes.set_ylim([-0.01, 1.01])
-        axes.set_xlim([-0.01, 1.01])
-        plt.legend()
-        plt.grid()
-        if SAVE_TO_FILE:
-        	folder_name = "graphs"
-        	if not os.path.exists(folder_name):
-        		os.makedirs(folder_name)
-        	plt.savefig(f'{folder_name}/{FILENAME_COUNTER}.png')
+        import plotting  # matplotlib is only imported when a figure is requested
+        plotting.show_plot(plt)
+
+    @staticmethod
+    def cross_validate(nb_template: NaiveBayes, dataset: List[List[str]], k: int = 3, n_jobs: int = 1, smoothing: float = None,
+                       compress: bool = False) -> CrossValidation:
+        return Util.cross_validate_encoded(nb_template, nb_template.encode(dataset), nb_template.encode_responses(dataset), k, n_jobs, smoothing,
+                                           compress = compress)
+
+    @staticmethod
+    def cross_validate_encoded(nb_template: NaiveBayes, codes: np.ndarray, response_ids: np.ndarray, k: int = 3, n_jobs: int = 1,
+                               smoothing: float = None, weights: Optional[np.ndarray] = None, compress: bool = False) -> CrossValidation:
+        # the model is trained once on the whole dataset; each fold's model is derived from it by subtracting the counts of its test rows.
+        # compress: every fold's test rows are collapsed to distinct (row, response) pairs with counts - same folds and results,
+        # but training and scoring work scales with distinct rows
+        tests = [Util.get_fold_views(len(codes), k, i)[1] for i in range(k)]
+        fold_data = [(codes[test], response_ids[test], weights[test] if weights is not None else None) for test in tests]
+        if compress:
+            fold_data = [Util.compress(*data) for data in fold_data]
+        model = nb_template.clone_untrained()
+        for fold_codes, fold_response_ids, fold_weights in fold_data:
+            model.load_encoded(fold_codes, fold_response_ids, fold_weights)
+        if n_jobs is None or n_jobs < 1:
+            n_jobs = os.cpu_count()
+        if n_jobs == 1:
+            results = [Util.score_fold(model, *data, smoothing) for data in fold_data]
+        else:
+            with ProcessPoolExecutor(max_workers = min(n_jobs, k)) as executor:
+                futures = [executor.submit(Util.score_fold, model, *data, smoothing) for data in fold_data]
+                results = [future.result() for future in futures]
+        folds = [Fold(tests[i].start, tests[i].stop, *results[i], fold_data[i][1], fold_data[i][2]) for i in range(k)]
+        return CrossValidation(model, folds)
+
+    @staticmethod
+    def compress(codes: np.ndarray, response_ids: np.ndarray, weights: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # (distinct rows, their responses, counts); identical rows with the same response are merged and their weights summed
+        if len(codes) == 0:
+            return (codes, response_ids, np.zeros(0, dtype = np.int64) if weights is None else weights)
+        if codes.dtype.kind == 'f':  # numeric feature values, rows are compared as they are
+            rows = np.column_stack((codes, response_ids))
+            radices = None
+        else:
+            rows = np.column_stack((codes.astype(np.int64), response_ids))
+            low = rows.min(axis = 0)
+            radices = (rows.max(axis = 0) - low + 1).tolist()
+        # every row as one mixed-radix number when it fits in 63 bits: a 1-D unique is much faster than a row-wise one
+        if radices is not None and np.prod([float(radix) for radix in radices]) < 2.0 ** 62:
+            keys = np.zeros(len(rows), dtype = np.int64)
+            for i in range(rows.shape[1]):
+                keys = keys * radices[i] + (rows[:, i] - low[i])
+            _, first, inverse = np.unique(keys, return_index = True, return_inverse = True)
+            unique_rows = rows[first]
         else:
-        	plt.show()
-        plt.clf()
-        FILENAME_COUNTER += 1
-
-    @staticmethod
-    def execute(nb: NaiveBayes, dataset: List[List[str]], positive: str, negative: str, plt_title: str, plt_line_type: str, data_points: int = 100):
-        nb1 = deepcopy(nb)
-        nb2 = deepcopy(nb)
-        nb3 = deepcopy(nb)
-        # for cross-validation
-        training1, test1 = Util.divide_dataset(dataset, num_of_divisions = 3, shift = 0)
-        training2, test2 = Util.divide_dataset(dataset, num_of_divisions = 3, shift = 1)
-        training3, test3 = Util.divide_dataset(dataset, num_of_divisions = 3, shift = 2)
-        nb1.load_training_dataset(training1)
-        nb2.load_training_dataset(training2)
-        nb3.load_training_dataset(training3)
+            unique_rows, inverse = np.unique(rows, axis = 0, return_inverse = True)
+        counts = np.bincount(inverse.ravel(), weights, minlength = len(unique_rows)).astype(np.int64)
+        return (unique_rows[:, :-1].astype(codes.dtype), unique_rows[:, -1].astype(response_ids.dtype), counts)
 
+    @staticmethod
+    def score_fold(model: NaiveBayes, codes: np.ndarray, response_ids: np.ndarray, weights: Optional[np.ndarray] = None,
+                   smoothing: float = None) -> Tuple[List[np.ndarray], np.ndarray, np.ndarray]:
+        fold_model = model.clone_untrained()
+        fold_model.merge(model)  # copies only the count arrays
+        fold_model.load_encoded(codes, response_ids, -weights if weights is not None else np.full(len(response_ids), -1))
+        scoring_model = fold_model.freeze(smoothing) if smoothing is not None else fold_model
+        probabilities = scoring_model.predict_proba_encoded(codes, weights)
+        return ([feature.matrix for feature in fold_model.features], fold_model.total_entries_per_response, probabilities)
+
+    @staticmethod
+    def evaluate(nb: NaiveBayes, dataset: List[List[str]], data_points: int = 100, smoothing: float = None, num_of_folds: int = 3,
+                 n_jobs: int = 1, compress: bool = True) -> Evaluation:  # any number of responses, no plotting
+        return Util.evaluate_encoded(nb, nb.encode(dataset), nb.encode_responses(dataset), data_points, smoothing, num_of_folds, n_jobs, compress)
+
+    @staticmethod
+    def evaluate_encoded(nb: NaiveBayes, codes: np.ndarray, response_ids: np.ndarray, data_points: int = 100, smoothing: float = None,
+                         num_of_folds: int = 3, n_jobs: int = 1, compress: bool = True) -> Evaluation:
+        cross_validation = Util.cross_validate_encoded(nb, codes, response_ids, k = num_of_folds, n_jobs = n_jobs, smoothing = smoothing,
+                                                       compress = compress)
+        evaluation = cross_validation.get_evaluation(data_points)
         if VERBOSE is True:
-            print("nb1 data example:")
-            nb1.debug_print()
+            evaluation.debug_print()
+        return evaluation
+
+    @staticmethod
+    def execute(nb: NaiveBayes, dataset: List[List[str]], positive: str, negative: str, plt_title: str = '', plt_line_type: str = 'b-', data_points: int = 100,
+                smoothing: float = None, num_of_folds: int = 3, n_jobs: int = 1, plot: bool = True,
+                compress: bool = True) -> RocCurve:  # plot = False: headless, returns the ROC only
+        return Util.execute_encoded(nb, nb.encode(dataset), nb.encode_responses(dataset), positive, negative, plt_title, plt_line_type, data_points,
+                                    smoothing, num_of_folds, n_jobs, plot, compress)
 
-        x_data = list()
-        y_data = list()
+    @staticmethod
+    def execute_encoded(nb: NaiveBayes, codes: np.ndarray, response_ids: np.ndarray, positive: str, negative: str, plt_title: str = '',
+                        plt_line_type: str = 'b-', data_points: int = 100, smoothing: float = None, num_of_folds: int = 3, n_jobs: int = 1,
+                        plot: bool = True, compress: bool = True) -> RocCurve:  # compress: duplicated rows are trained and scored once, same results
+        cross_validation = Util.cross_validate_encoded(nb, codes, response_ids, k = num_of_folds, n_jobs = n_jobs, smoothing = smoothing,
+                                                       compress = compress)
+
+        if VERBOSE is True:
+            print("model trained on the whole dataset:")
+            cross_validation.model.debug_print()
 
         print("calculating ROC curve")
-        tests = [test1, test2, test3]
-        nbs = [nb1, nb2, nb3]
-        for i in range(data_points):
-            if (i + 1) % (data_points / 10) == 0:
-                print(f'{int(i / data_points * 100) + 1}%')
-            true_positives = 0
-            false_positives = 0
-            true_negatives = 0
-            false_negatives = 0
-            cut_off_point = i / data_points
-            for j in range(len(tests)):
-                for line in tests[j]:
-                    correct_response = line[-1]
-                    probabilities = nbs[j].get_probabilities_for_responses(line[:-1])
-                    result = negative
-                    if probabilities[1] >= cut_off_point:
-                        result = positive
-                    if result == negative and correct_response == negative:
-                        true_negatives += 1
-                    elif result == negative and correct_response == positive:
-                        false_negatives += 1
-                    elif result == positive and correct_response == negative:
-                        false_positives += 1
-                    elif result == positive and correct_response == positive:
-                        true_positives += 1
-            true_positives_rate = true_positives / ( true_positives + false_negatives )
-            true_negatives_rate = true_negatives / ( true_negatives + false_positives )
-            false_positives_rate = 1 - true_negatives_rate
-            x_data.append(false_positives_rate)
-            y_data.append(true_positives_rate)
-
-        # process duplicated x values
-        xy_data_sum = dict()
-        xy_data_num = dict()
-        for i in range(len(x_data)):
-            if x_data[i] in xy_data_sum:
-                xy_data_sum[x_data[i]] += y_data[i]
-                xy_data_num[x_data[i]] += 1
-            else:
-                xy_data_sum[x_data[i]] = y_data[i]
-                xy_data_num[x_data[i]] = 1
-        for key in xy_data_sum.keys():
-            xy_data_sum[key] /= xy_data_num[key]  # average y values for duplicated x values
-        plt.title(plt_title)
-        plt.plot(xy_data_sum.keys(), xy_data_sum.values(), plt_line_type, label = "naive binary Bayes classifier")
-        Util.show_plot(plt)
+        roc = cross_validation.get_roc(nb.get_response_id(positive), nb.get_response_id(negative), data_points)
+        if VERBOSE is True:
+            print(f'AUC: {roc.auc:.4f}')
+
+        if plot:
+            import plotting
+            plotting.plot_roc(roc, plt_title, plt_line_type)
+        return roc
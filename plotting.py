@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+__copyright__ = "Copyright 2020, Piotr Obst"
+
+# reporting layer - the only module that imports matplotlib, import it only when a figure is needed
+
+import os
+import threading
+from typing import Optional
+
+import matplotlib.pyplot as plt
+
+from evaluation import RocCurve
+
+
+FILENAME_COUNTER = 1
+SAVE_TO_FILE = 1  # 0 = display on the screen, don't save; 1 = save to file, don't display
+LOCK = threading.RLock()  # pyplot keeps one current figure per process, so figures are drawn one at a time
+
+
+def show_plot(plt = plt, filename: Optional[str] = None):  # filename overrides graphs/<counter>.png
+    with LOCK:
+        draw(plt, filename)
+
+
+def draw(plt, filename: Optional[str]):
+    global FILENAME_COUNTER
+    plt.plot([0, 1], [0, 1], f"r:", label = f"random classifier")
+    plt.xlabel("False-positives rate")
+    plt.ylabel("True-positives rate")
+    axes = plt.gca()
+    axes.set_ylim([-0.01, 1.01])
+    axes.set_xlim([-0.01, 1.01])
+    plt.legend()
+    plt.grid()
+    if filename is not None:
+        plt.savefig(filename)
+    elif SAVE_TO_FILE:
+        folder_name = "graphs"
+        if not os.path.exists(folder_name):
+            os.makedirs(folder_name)
+        plt.savefig(f'{folder_name}/{FILENAME_COUNTER}.png')
+        FILENAME_COUNTER += 1
+    else:
+        plt.show()
+        FILENAME_COUNTER += 1
+    plt.clf()
+
+
+def plot_roc(roc: RocCurve, title: str, line_type: str, filename: Optional[str] = None):
+    with LOCK:
+        plt.title(title)
+        plt.plot(roc.grid_fpr, roc.grid_tpr, line_type, label = "naive binary Bayes classifier")
+        show_plot(plt, filename)
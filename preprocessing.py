@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+__copyright__ = "Copyright 2020, Piotr Obst"
+
+from bisect import bisect_right
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+
+class Pipeline:
+    '''
+        Row cleaning steps applied in a single pass, in the order they were added.
+        Column indices refer to the row as it is at that step (after earlier drops).
+        Steps are stored as plain tuples, so a pipeline without custom predicates can be pickled.
+    '''
+
+    def __init__(self):
+        self.steps = list()
+
+    def keep_if_equal(self, column: int, value: str):
+        self.steps.append(('keep_if_equal', column, value))
+
+    def drop_rows_with(self, value: str):  # e.g. missing values marked with '?'
+        self.steps.append(('drop_rows_with', value))
+
+    def filter(self, predicate: Callable[[List[str]], bool]):  # keep rows for which predicate is true
+        self.steps.append(('filter', predicate))
+
+    def drop_columns(self, columns: Sequence[int]):
+        self.steps.append(('drop_columns', tuple(sorted(set(columns)))))
+
+    def bin(self, column: int, edges: Sequence[float]):
+        # value < edges[0] -> '0', edges[0] <= value < edges[1] -> '1', ..., value >= edges[-1] -> str(len(edges))
+        self.steps.append(('bin', column, tuple(edges)))
+
+    def replace(self, column: int, mapping: Dict[str, str]):
+        self.steps.append(('replace', column, dict(mapping)))
+
+    def compile(self) -> List[Callable[[List[str]], Optional[List[str]]]]:
+        functions = list()
+        for step in self.steps:
+            functions.append(getattr(Pipeline, f'_compile_{step[0]}')(*step[1:]))
+        return functions
+
+    @staticmethod
+    def _compile_keep_if_equal(column: int, value: str):
+        return lambda line: line if line[column] == value else None
+
+    @staticmethod
+    def _compile_drop_rows_with(value: str):
+        return lambda line: None if value in line else line
+
+    @staticmethod
+    def _compile_filter(predicate: Callable[[List[str]], bool]):
+        return lambda line: line if predicate(line) else None
+
+    @staticmethod
+    def _compile_drop_columns(columns: Sequence[int]):
+        dropped = set(columns)
+
+        def drop(line: List[str]) -> List[str]:
+            return [line[i] for i in range(len(line)) if i not in dropped]
+        return drop
+
+    @staticmethod
+    def _compile_bin(column: int, edges: Sequence[float]):
+        labels = [str(i) for i in range(len(edges) + 1)]
+
+        def bin_column(line: List[str]) -> List[str]:
+            line[column] = labels[bisect_right(edges, float(line[column]))]
+            return line
+        return bin_column
+
+    @staticmethod
+    def _compile_replace(column: int, mapping: Dict[str, str]):
+        def replace(line: List[str]) -> List[str]:
+            line[column] = mapping.get(line[column], line[column])
+            return line
+        return replace
+
+    def apply(self, dataset: Iterable[List[str]]) -> List[List[str]]:  # lines are modified in place
+        functions = self.compile()
+        result = list()
+        for line in dataset:
+            for function in functions:
+                line = function(line)
+                if line is None:
+                    break
+            else:
+                result.append(line)
+        return result
+
+    def stream(self, batches: Iterable[List[List[str]]]) -> Iterator[List[List[str]]]:  # e.g. batches from Util.iter_file
+        for batch in batches:
+            yield self.apply(batch)
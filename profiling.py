@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+'''
+    Runs a script of this repository (main.py by default) with instrumentation enabled, optionally under cProfile and tracemalloc:
+        python profiling.py [--cprofile OUT.prof] [--sort cumulative] [--top 25] [--tracemalloc] [--metrics OUT.prom] [SCRIPT [ARGS ...]]
+    e.g. python profiling.py --cprofile main.prof --tracemalloc main.py --no-plot
+    Counters and phase timers are printed when the script finishes (or --metrics writes them in the Prometheus text format).
+'''
+
+__copyright__ = "Copyright 2020, Piotr Obst"
+
+import argparse
+import cProfile
+import pstats
+import runpy
+import sys
+import tracemalloc
+from typing import List
+
+import instrumentation
+
+
+def main(arguments: List[str]):
+    parser = argparse.ArgumentParser(description = 'Profile a script with instrumentation, cProfile and tracemalloc.')
+    parser.add_argument('--cprofile', metavar = 'FILE', help = 'run under cProfile and dump the statistics to FILE (readable by pstats/snakeviz)')
+    parser.add_argument('--sort', default = 'cumulative', help = 'pstats sort key of the printed cProfile summary')
+    parser.add_argument('--top', type = int, default = 25, help = 'number of functions/allocation sites printed')
+    parser.add_argument('--tracemalloc', action = 'store_true', help = 'trace allocations and print the largest allocation sites')
+    parser.add_argument('--metrics', metavar = 'FILE', help = 'write the counters and phase timers in the Prometheus text format')
+    parser.add_argument('script', nargs = '?', default = 'main.py')
+    parser.add_argument('arguments', nargs = argparse.REMAINDER)
+    args = parser.parse_args(arguments)
+
+    stats = instrumentation.enable()
+    if args.tracemalloc:
+        tracemalloc.start()
+    profiler = cProfile.Profile() if args.cprofile is not None else None
+    sys.argv = [args.script] + args.arguments  # the script sees its own command line
+    try:
+        if profiler is not None:
+            profiler.enable()
+        runpy.run_path(args.script, run_name = '__main__')
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        instrumentation.disable()
+
+        if profiler is not None:
+            profiler.dump_stats(args.cprofile)
+            pstats.Stats(profiler, stream = sys.stderr).sort_stats(args.sort).print_stats(args.top)
+        if args.tracemalloc:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f'peak traced memory: {peak / 1024 / 1024:.1f} MiB', file = sys.stderr)
+            for statistic in snapshot.statistics('lineno')[:args.top]:
+                print(statistic, file = sys.stderr)
+        if args.metrics is not None:
+            with open(args.metrics, 'w') as file:
+                file.write(stats.to_prometheus())
+        else:
+            stats.debug_print()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+__copyright__ = "Copyright 2020, Piotr Obst"
+
+from copy import deepcopy
+import json
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import instrumentation
+from naive_bayes import Feature, GaussianFeature, HashedFeature, HistogramFeature, NaiveBayes, Util
+from preprocessing import Pipeline
+
+
+class Schema:
+    '''
+        Declarative description of a dataset:
+        {
+            'filename': 'cmc.data', 'delimiter': ',', 'class_attribute_index': 9,
+            'class': {'categories': ['1', '2'], 'positive': '2', 'negative': '1', 'replace': {'3': '2'}},
+            'missing': '?',                         # optional, rows containing this value anywhere are dropped
+            'columns': [                            # every attribute except the class one, in file order
+                {'name': 'wife_age', 'bins': [21, 26, 31]},                 # numeric, binned to '0', '1', ... while cleaning
+                {'name': 'children', 'histogram': [1, 2, 3]},               # numeric, counted in bins by the feature itself
+                {'name': 'capital_gain', 'gaussian': True},                 # numeric, one normal distribution per class
+                {'name': 'wife_education', 'categories': ['1', '2', '3', '4']},
+                {'name': 'zip_code', 'hashed': 4096},                       # any values, counted in this many hashed buckets
+                {'name': 'country', 'drop': True, 'equals': 'USA'},         # rows with other values are dropped
+                ...
+            ],
+        }
+        Column keys: name, categories (vocabulary, may be inferred), bins (edges), histogram (edges), gaussian, hashed (number of buckets),
+        drop, equals (row filter), unknown (policy for categories outside the vocabulary, or for values that aren't numbers).
+    '''
+
+    def __init__(self, definition: Dict):
+        self.definition = definition
+        self.columns = definition['columns']
+        self.features = [column for column in self.columns if not column.get('drop', False)]
+
+    @staticmethod
+    def from_json(filename: str) -> 'Schema':
+        with open(filename, 'r') as file:
+            return Schema(json.load(file))
+
+    def get_positive(self) -> str:
+        return self.definition['class']['positive']
+
+    def get_negative(self) -> str:
+        return self.definition['class']['negative']
+
+    def get_categories(self, column: Dict) -> List[str]:
+        if 'bins' in column:
+            return [str(i) for i in range(len(column['bins']) + 1)]
+        if 'histogram' in column:
+            return [str(i) for i in range(len(column['histogram']) + 1)]
+        return column.get('categories', list())
+
+    @staticmethod
+    def is_numeric(column: Dict) -> bool:  # no vocabulary to infer
+        return 'bins' in column or 'histogram' in column or column.get('gaussian', False)
+
+    def load(self, filename: Optional[str] = None, seed: Optional[int] = None) -> List[List[str]]:
+        return Util.load_file(filename or self.definition['filename'], self.definition['class_attribute_index'], self.definition['delimiter'], seed)
+
+    def load_encoded(self, nb: Optional[NaiveBayes] = None, cache = None, filename: Optional[str] = None,
+                     seed: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:  # cleaned (codes, response_ids), cache: DatasetCache
+        if cache is not None:
+            return cache.load(self, nb, filename, seed)
+        return self.compile_encoder(nb).encode(self.load(filename, seed))
+
+    def build_model(self) -> NaiveBayes:
+        nb = NaiveBayes()
+        for response in self.definition['class']['categories']:
+            nb.add_response(response)
+        for column in self.features:
+            if column.get('gaussian', False):
+                feature = GaussianFeature(column['name'], len(nb.responses), column.get('unknown', 'error'))
+            elif 'hashed' in column:
+                feature = HashedFeature(column['name'], len(nb.responses), column['hashed'])
+            elif 'histogram' in column:
+                feature = HistogramFeature(column['name'], len(nb.responses), column['histogram'], column.get('unknown', 'error'))
+            else:
+                feature = Feature(column['name'], len(nb.responses), column.get('unknown', 'error'))
+                feature.add_categories(self.get_categories(column))
+            nb.add_feature(feature)
+        return nb
+
+    def fit_file(self, filename: Optional[str] = None, n_workers: Optional[int] = None, nb: Optional[NaiveBayes] = None) -> NaiveBayes:
+        nb = nb if nb is not None else self.build_model()
+        return nb.fit_file(filename or self.definition['filename'], self.definition['class_attribute_index'], self.definition['delimiter'],
+                           n_workers, self.build_pipeline())
+
+    def build_pipeline(self, with_class: bool = True) -> Pipeline:
+        # cleans loaded rows (class attribute last) into rows the model accepts; with_class = False: rows of features only
+        pipeline = Pipeline()
+        for i in range(len(self.columns)):
+            if 'equals' in self.columns[i]:
+                pipeline.keep_if_equal(i, self.columns[i]['equals'])
+        if 'missing' in self.definition:
+            pipeline.drop_rows_with(self.definition['missing'])
+        pipeline.drop_columns([i for i in range(len(self.columns)) if self.columns[i].get('drop', False)])
+        for i in range(len(self.features)):
+            if 'bins' in self.features[i]:
+                pipeline.bin(i, self.features[i]['bins'])
+        if with_class and 'replace' in self.definition['class']:
+            pipeline.replace(len(self.features), self.definition['class']['replace'])
+        return pipeline
+
+    def compile_encoder(self, nb: Optional[NaiveBayes] = None) -> 'RowEncoder':
+        return RowEncoder(self, nb if nb is not None else self.build_model())
+
+    def infer_vocabularies(self, filename: Optional[str] = None) -> 'Schema':
+        # one streaming pass; categories are kept in order of first appearance, declared ones come first
+        definition = deepcopy(self.definition)
+        filters = self.build_pipeline()
+        filters.steps = [step for step in filters.steps if step[0] in ('keep_if_equal', 'drop_rows_with')]
+        inferred = [i for i, column in enumerate(definition['columns'])
+                    if not column.get('drop', False) and not Schema.is_numeric(column) and 'hashed' not in column]
+        vocabularies = {i: dict.fromkeys(definition['columns'][i].get('categories', list())) for i in inferred}
+        classes = dict.fromkeys(definition['class'].get('categories', list()))
+        replace = definition['class'].get('replace', dict())
+        for batch in filters.stream(Util.iter_file(filename or definition['filename'], definition['class_attribute_index'], definition['delimiter'])):
+            for line in batch:
+                for i in inferred:
+                    vocabularies[i][line[i]] = None
+                classes[replace.get(line[-1], line[-1])] = None
+        for i in inferred:
+            definition['columns'][i]['categories'] = list(vocabularies[i].keys())
+        definition['class']['categories'] = list(classes.keys())
+        return Schema(definition)
+
+
+class RowEncoder:  # loaded rows (class attribute last) -> filtered integer codes, without building cleaned string rows
+
+    def __init__(self, schema: Schema, nb: NaiveBayes):
+        self.schema = schema
+        self.nb = nb
+        self.filters = [(i, column['equals']) for i, column in enumerate(schema.columns) if 'equals' in column]
+        self.feature_columns = [i for i, column in enumerate(schema.columns) if not column.get('drop', False)]
+        self.bins = [np.array(column['bins'], dtype = np.float64) if 'bins' in column else None for column in schema.features]
+        self.missing = schema.definition.get('missing')
+        self.replace = schema.definition['class'].get('replace', dict())
+
+    def accepts(self, row: List[str]) -> bool:
+        for i, value in self.filters:
+            if row[i] != value:
+                return False
+        return self.missing is None or self.missing not in row
+
+    def encode(self, rows: Sequence[List[str]]) -> Tuple[np.ndarray, np.ndarray]:  # (codes, response_ids)
+        with instrumentation.timer('encode'):
+            if len(self.filters) > 0 or self.missing is not None:
+                rows = [row for row in rows if self.accepts(row)]
+            codes = np.empty((len(rows), len(self.nb.features)), dtype = NaiveBayes.get_code_dtype(self.nb.features))
+            for i in range(len(self.feature_columns)):
+                column = [row[self.feature_columns[i]] for row in rows]
+                if self.bins[i] is not None:  # bin i is category i, no intermediate strings
+                    codes[:, i] = np.searchsorted(self.bins[i], np.array(column, dtype = np.float64), side = 'right')
+                else:
+                    codes[:, i] = self.nb.features[i].encode(column)
+            responses = [self.replace.get(row[-1], row[-1]) for row in rows]
+            response_ids = np.fromiter(map(self.nb.get_response_id, responses), dtype = np.intp, count = len(responses))
+        return (codes, response_ids)
+
+
+class Dataset:  # a bundled dataset described by SCHEMA; subclasses add execute() and their own experiments
+
+    SCHEMA = None
+
+    @classmethod
+    def load(cls, filename: Optional[str] = None, seed: Optional[int] = None) -> List[List[str]]:
+        return cls.SCHEMA.load(filename, seed)
+
+    @classmethod
+    def load_encoded(cls, nb: NaiveBayes, cache = None, filename: Optional[str] = None,
+                     seed: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:  # load + clean + encode, (codes, response_ids)
+        return cls.SCHEMA.load_encoded(nb, cache, filename, seed)
+
+    @classmethod
+    def clean(cls, dataset: List[List[str]], with_class: bool = True) -> List[List[str]]:
+        return cls.SCHEMA.build_pipeline(with_class).apply(dataset)
+
+    @classmethod
+    def build_model(cls) -> Tuple[NaiveBayes, str, str]:  # (model, positive, negative)
+        return (cls.SCHEMA.build_model(), cls.SCHEMA.get_positive(), cls.SCHEMA.get_negative())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+'''
+    Bulk scoring of a data file with a trained model:
+        python score.py MODEL_FILE INPUT OUTPUT [--delimiter ,] [--class-attribute-index N] [--dataset cmc|mushroom|income]
+                        [--workers N] [--smoothing 1.0] [--unknown error|skip|bucket]
+    The input uses the conventions of Util.load_file: one row per line, attributes separated by the delimiter. If
+    --class-attribute-index is given, that column is taken out of the features and written as "actual".
+    --dataset applies that dataset's cleaning first (rows it filters out are not written).
+    The input is split into byte ranges scored by parallel worker processes; the output keeps the input order:
+        <response 1>,<response 2>,...,predicted[,actual]
+    in the CSV dialect of the csv module (values are quoted when needed).
+'''
+
+__copyright__ = "Copyright 2020, Piotr Obst"
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import os
+import shutil
+import sys
+from typing import List, Optional
+
+from datasets import DATASETS
+from model_io import ModelFile
+from naive_bayes import BATCH_SIZE, Util
+from sharding import FileShards
+
+
+class Scorer:
+
+    def __init__(self, model_filename: str, delimiter: str, class_attribute_index: Optional[int], dataset: Optional[str],
+                 smoothing: Optional[float], unknown_policy: Optional[str]):
+        self.model_filename = model_filename
+        self.delimiter = delimiter
+        self.class_attribute_index = class_attribute_index
+        self.dataset = dataset
+        self.smoothing = smoothing
+        self.unknown_policy = unknown_policy
+
+    def load_model(self):
+        nb = ModelFile.load(self.model_filename)  # memory-mapped, all workers share the tables
+        if self.unknown_policy is not None:
+            nb.set_unknown_policy(self.unknown_policy)
+        return nb.freeze(self.smoothing) if self.smoothing is not None else nb
+
+    def write_header(self, output):
+        header = [str(response) for response in ModelFile.read_header(self.model_filename)['responses']] + ['predicted']
+        if self.class_attribute_index is not None:
+            header.append('actual')
+        csv.writer(output, lineterminator = '\n').writerow(header)
+
+    def parse(self, line: str) -> Optional[List[str]]:
+        if self.class_attribute_index is not None:
+            return Util.parse_line(line, self.class_attribute_index, self.delimiter)
+        attributes = line.strip().split(self.delimiter)
+        return attributes if len(attributes) >= 2 else None  # same rule as Util.load_file
+
+    def write_batch(self, model, responses: List[str], batch: List[List[str]], output):
+        if self.dataset is not None:
+            batch = DATASETS[self.dataset].clean(batch, with_class = self.class_attribute_index is not None)
+        if len(batch) == 0:
+            return 0
+        features = batch if self.class_attribute_index is None else [line[:-1] for line in batch]
+        probabilities = model.predict_proba_encoded(model.encode(features))
+        predictions = probabilities.argmax(axis = 1)
+        lines = list()
+        for i in range(len(batch)):
+            values = [repr(float(probability)) for probability in probabilities[i]] + [responses[predictions[i]]]
+            if self.class_attribute_index is not None:
+                values.append(batch[i][-1])
+            lines.append(values)
+        csv.writer(output, lineterminator = '\n').writerows(lines)  # responses containing commas or quotes are quoted
+        return len(batch)
+
+    def score_shard(self, input_filename: str, start: int, end: int, output_filename: str) -> int:
+        model = self.load_model()
+        responses = [str(response) for response in model.responses]
+        num_of_rows = 0
+        batch = list()
+        with open(output_filename, 'w') as output:
+            for line in FileShards.iter_lines(input_filename, start, end):
+                row = self.parse(line)
+                if row is None:
+                    continue
+                batch.append(row)
+                if len(batch) == BATCH_SIZE:
+                    num_of_rows += self.write_batch(model, responses, batch, output)
+                    batch = list()
+            num_of_rows += self.write_batch(model, responses, batch, output)
+        return num_of_rows
+
+    def score_file(self, input_filename: str, output_filename: str, workers: int) -> int:
+        shards = FileShards.split(input_filename, workers)
+        part_filenames = [f'{output_filename}.part{i}' for i in range(len(shards))]
+        try:
+            if workers == 1:
+                counts = [self.score_shard(input_filename, start, end, part) for (start, end), part in zip(shards, part_filenames)]
+            else:
+                with ProcessPoolExecutor(max_workers = workers) as executor:
+                    futures = [executor.submit(self.score_shard, input_filename, start, end, part) for (start, end), part in zip(shards, part_filenames)]
+                    counts = [future.result() for future in futures]
+            with open(output_filename, 'w') as output:
+                self.write_header(output)
+                for part in part_filenames:  # concatenated in shard order, so rows stay in input order
+                    with open(part, 'r') as part_file:
+                        shutil.copyfileobj(part_file, output)
+        finally:
+            for part in part_filenames:
+                if os.path.exists(part):
+                    os.remove(part)
+        return sum(counts)
+
+
+def main(arguments: List[str]):
+    parser = argparse.ArgumentParser(description = 'Write per-row posteriors and the predicted class for every row of a data file.')
+    parser.add_argument('model', help = 'model file written by ModelFile.save (see model_io.py)')
+    parser.add_argument('input')
+    parser.add_argument('output')
+    parser.add_argument('--delimiter', default = ',')
+    parser.add_argument('--class-attribute-index', type = int, help = 'column with the correct class, excluded from the features')
+    parser.add_argument('--dataset', choices = list(DATASETS.keys()), help = 'clean the rows like this bundled dataset does')
+    parser.add_argument('--workers', type = int, default = os.cpu_count())
+    parser.add_argument('--smoothing', type = float, help = 'score with log-space tables using this Lidstone smoothing')
+    parser.add_argument('--unknown', choices = ['error', 'skip', 'bucket'], help = 'override the unknown category policy of the model')
+    args = parser.parse_args(arguments)
+
+    scorer = Scorer(args.model, args.delimiter, args.class_attribute_index, args.dataset, args.smoothing, args.unknown)
+    num_of_rows = scorer.score_file(args.input, args.output, max(args.workers, 1))
+    print(f'scored {num_of_rows} rows', file = sys.stderr)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+'''
+    Prediction server: loads a trained model once and scores rows over HTTP (TCP or Unix socket).
+        python server.py MODEL_FILE [--host 127.0.0.1] [--port 8080 | --unix-socket PATH] [--smoothing 1.0]
+                                    [--max-batch-rows 4096] [--max-delay-ms 2] [--cache-size N]
+    POST /predict   JSON {"row": [...]} or {"rows": [[...], ...]}, or CSV lines (Content-Type: text/csv, ?delimiter=,)
+                    -> {"responses": [...], "probabilities": [[...], ...], "predictions": [...]}
+    GET /stats      request/row counts, batch sizes, latency percentiles and posterior cache hits
+    GET /health
+    Concurrent requests are coalesced into micro-batches and scored with one vectorized call.
+'''
+
+__copyright__ = "Copyright 2020, Piotr Obst"
+
+import argparse
+import asyncio
+from collections import deque
+import json
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from model_io import ModelFile
+
+
+LATENCY_WINDOW = 10000  # percentiles are computed over this many most recent requests
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+
+class MicroBatcher:
+
+    def __init__(self, model, max_batch_rows: int, max_delay: float):
+        self.model = model  # NaiveBayes or FrozenNaiveBayes
+        self.max_batch_rows = max_batch_rows
+        self.max_delay = max_delay  # seconds to wait for more requests after the first one arrives
+        self.queue = asyncio.Queue()
+        self.batch_sizes = deque(maxlen = LATENCY_WINDOW)
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def predict(self, codes: np.ndarray) -> np.ndarray:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((codes, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            num_of_rows = len(pending[0][0])
+            deadline = loop.time() + self.max_delay
+            while num_of_rows < self.max_batch_rows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+                num_of_rows += len(pending[-1][0])
+            self.batch_sizes.append(num_of_rows)
+            codes = np.concatenate([item[0] for item in pending])
+            try:
+                # numpy releases the GIL, so scoring in a thread keeps the event loop accepting requests
+                probabilities = await loop.run_in_executor(None, self.model.predict_proba_encoded, codes)
+            except Exception as exception:
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(exception)
+                continue
+            start = 0
+            for item_codes, future in pending:
+                if not future.done():
+                    future.set_result(probabilities[start:start + len(item_codes)])
+                start += len(item_codes)
+
+
+class PredictionServer:
+
+    def __init__(self, model, max_batch_rows: int, max_delay: float):
+        self.model = model
+        self.responses = list(model.responses.keys())
+        self.batcher = MicroBatcher(model, max_batch_rows, max_delay)
+        self.latencies = deque(maxlen = LATENCY_WINDOW)
+        self.num_of_requests = 0
+        self.num_of_rows = 0
+        self.num_of_errors = 0
+
+    def get_stats(self) -> Dict:
+        stats = {'requests': self.num_of_requests, 'rows': self.num_of_rows, 'errors': self.num_of_errors}
+        if len(self.latencies) > 0:
+            latencies = np.array(self.latencies) * 1000
+            for percentile in [50, 90, 95, 99]:
+                stats[f'latency_p{percentile}_ms'] = float(np.percentile(latencies, percentile))
+            stats['latency_max_ms'] = float(latencies.max())
+        if len(self.batcher.batch_sizes) > 0:
+            stats['mean_batch_rows'] = float(np.mean(self.batcher.batch_sizes))
+            stats['max_batch_rows'] = int(max(self.batcher.batch_sizes))
+        if self.model.cache is not None:
+            stats['cache'] = self.model.cache.get_stats()
+        return stats
+
+    @staticmethod
+    def parse_rows(body: bytes, content_type: str, query: Dict[str, List[str]]) -> List[List[str]]:
+        if content_type.startswith('text/csv') or content_type.startswith('text/plain'):
+            delimiter = query.get('delimiter', [','])[0]
+            return [line.strip().split(delimiter) for line in body.decode('utf-8').splitlines() if line.strip() != '']
+        request = json.loads(body)
+        if 'row' in request:
+            return [request['row']]
+        return request['rows']
+
+    async def predict(self, body: bytes, content_type: str, query: Dict[str, List[str]]) -> Tuple[int, Dict]:
+        try:
+            rows = PredictionServer.parse_rows(body, content_type, query)
+            codes = self.model.encode(rows)
+        except (ValueError, KeyError, IndexError, TypeError) as exception:  # malformed body or unknown category
+            self.num_of_errors += 1
+            return (400, {'error': str(exception)})
+        probabilities = await self.batcher.predict(codes) if len(rows) > 0 else np.zeros((0, len(self.responses)))
+        self.num_of_rows += len(rows)
+        return (200, {
+            'responses': self.responses,
+            'probabilities': probabilities.tolist(),
+            'predictions': [self.responses[i] for i in probabilities.argmax(axis = 1)],
+        })
+
+    async def handle(self, method: str, target: str, headers: Dict[str, str], body: bytes) -> Tuple[int, Dict]:
+        url = urlsplit(target)
+        if method == 'POST' and url.path == '/predict':
+            return await self.predict(body, headers.get('content-type', 'application/json'), parse_qs(url.query))
+        if method == 'GET' and url.path == '/stats':
+            return (200, self.get_stats())
+        if method == 'GET' and url.path == '/health':
+            return (200, {'status': 'ok'})
+        return (404, {'error': f'no such endpoint: {method} {url.path}'})
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                start = time.perf_counter()
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY_SIZE:
+                    status, response = (413, {'error': 'request body too large'})
+                    headers['connection'] = 'close'
+                else:
+                    body = await reader.readexactly(length) if length > 0 else b''
+                    status, response = await self.handle(method, target, headers, body)
+                payload = json.dumps(response).encode('utf-8')
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(f'HTTP/1.1 {status} {"OK" if status == 200 else "Error"}\r\n'
+                             f'Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n'
+                             f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode('latin-1') + payload)
+                await writer.drain()
+                if method == 'POST':
+                    self.num_of_requests += 1
+                    self.latencies.append(time.perf_counter() - start)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int, unix_socket: Optional[str]):
+        self.batcher.start()
+        if unix_socket is not None:
+            server = await asyncio.start_unix_server(self.serve_connection, path = unix_socket)
+            print(f'serving on unix socket {unix_socket}', file = sys.stderr)
+        else:
+            server = await asyncio.start_server(self.serve_connection, host, port)
+            print(f'serving on http://{host}:{port}', file = sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+
+def main(arguments: List[str]):
+    parser = argparse.ArgumentParser(description = 'Serve a trained naive Bayes model over HTTP with micro-batching.')
+    parser.add_argument('model', help = 'model file written by ModelFile.save (see model_io.py)')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8080)
+    parser.add_argument('--unix-socket', help = 'listen on this Unix socket instead of TCP')
+    parser.add_argument('--smoothing', type = float, help = 'score with log-space tables using this Lidstone smoothing')
+    parser.add_argument('--max-batch-rows', type = int, default = 4096)
+    parser.add_argument('--max-delay-ms', type = float, default = 2.0)
+    parser.add_argument('--cache-size', type = int, default = 0, help = 'remember the probabilities of this many distinct rows (0: no cache)')
+    args = parser.parse_args(arguments)
+
+    model = ModelFile.load(args.model)
+    if args.smoothing is not None:
+        model = model.freeze(args.smoothing)
+    if args.cache_size > 0:
+        model.enable_cache(args.cache_size)
+    server = PredictionServer(model, args.max_batch_rows, args.max_delay_ms / 1000)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix_socket))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
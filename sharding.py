@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+
+__copyright__ = "Copyright 2020, Piotr Obst"
+
+import os
+from typing import Iterator, List, Tuple
+
+
+class FileShards:
+
+    @staticmethod
+    def split(filename: str, num_of_shards: int) -> List[Tuple[int, int]]:  # [(start, end)] byte ranges, each starting at a line
+        size = os.path.getsize(filename)
+        boundaries = [0]
+        with open(filename, 'rb') as file:
+            for i in range(1, num_of_shards):
+                file.seek(max(size * i // num_of_shards - 1, boundaries[-1]))
+                file.readline()  # move to the beginning of the next line
+                boundaries.append(min(file.tell(), size))
+        boundaries.append(size)
+        return [(boundaries[i], boundaries[i + 1]) for i in range(num_of_shards) if boundaries[i] < boundaries[i + 1]]
+
+    @staticmethod
+    def iter_lines(filename: str, start: int, end: int, encoding: str = 'utf-8') -> Iterator[str]:
+        with open(filename, 'rb') as file:
+            file.seek(start)
+            position = start
+            for line in file:
+                if position >= end:
+                    break
+                position += len(line)
+                yield line.decode(encoding)
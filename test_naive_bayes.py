@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+__copyright__ = "Copyright 2020, Piotr Obst"
+
+# run with: python -m unittest (or python -m pytest) from this folder
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from naive_bayes import Feature, GaussianFeature, HistogramFeature, NaiveBayes
+from schema import Schema
+
+
+DEFINITION = {
+    'delimiter': ',',
+    'class_attribute_index': 2,
+    'class': {'categories': ['yes', 'no'], 'positive': 'yes', 'negative': 'no'},
+    'missing': '?',
+    'columns': [{'name': 'color', 'categories': ['red', 'blue']}, {'name': 'size', 'categories': ['s', 'l']}],
+}
+
+
+class IterBatchesTest(unittest.TestCase):
+
+    def test_filtered_out_shard(self):  # the last shard only has rows with missing values, its batch is empty after cleaning
+        lines = ['red,s,yes', 'blue,l,no', 'red,l,yes', 'blue,s,no'] * 50 + ['?,s,yes', 'red,?,no'] * 50
+        with tempfile.NamedTemporaryFile('w', suffix = '.data', delete = False) as file:
+            file.write('\n'.join(lines) + '\n')
+        try:
+            schema = Schema(dict(DEFINITION, filename = file.name))
+            serial = schema.fit_file(n_workers = 1)
+            parallel = schema.fit_file(n_workers = 4)
+        finally:
+            os.remove(file.name)
+        self.assertEqual(serial.num_of_entries, 200)
+        self.assertEqual(parallel.num_of_entries, 200)
+        for serial_feature, parallel_feature in zip(serial.features, parallel.features):
+            np.testing.assert_array_equal(serial_feature.matrix, parallel_feature.matrix)
+
+    def test_rows_and_batches(self):
+        self.assertEqual(list(NaiveBayes.iter_batches([[['a', 'x']], [], ['b', 'y']])), [[['a', 'x']], [['b', 'y']]])
+
+    def test_numeric_rows(self):  # a row starting with a number is still a row
+        nb = NaiveBayes()
+        nb.add_response('yes')
+        nb.add_response('no')
+        nb.add_feature(GaussianFeature('age', 2))
+        nb.load_training_dataset([[20.0, 'yes'], [30.0, 'yes'], [50.0, 'no']])
+        self.assertEqual(nb.num_of_entries, 3)
+        np.testing.assert_allclose(nb.features[0].matrix[1], [25.0, 50.0])
+
+
+class StateKeyTest(unittest.TestCase):
+
+    def test_feature_changed_directly(self):  # cached likelihood tables and posteriors follow changes made on a feature
+        nb = NaiveBayes()
+        nb.add_response('a')
+        nb.add_response('b')
+        feature = Feature('x', 2)
+        feature.add_category('x')
+        nb.add_feature(feature)
+        nb.enable_cache()
+        nb.load_training_dataset([['x', 'a'], ['x', 'b']])
+        self.assertEqual(nb.get_probabilities_for_responses(['x']), [0.5, 0.5])
+        feature.add_category('y')
+        feature.add_entry('y', 0)
+        self.assertEqual(nb.get_probabilities_for_responses(['y']), [1.0, 0.0])
+        np.testing.assert_array_equal(nb.predict_proba_batch([['y']]), [[1.0, 0.0]])
+        feature.set_unknown_policy('bucket')
+        np.testing.assert_array_equal(nb.predict_proba_batch([['z']]), [[0.0, 0.0]])
+
+
+class MergeTest(unittest.TestCase):
+
+    @staticmethod
+    def build(feature: Feature) -> NaiveBayes:
+        nb = NaiveBayes()
+        nb.add_response('yes')
+        nb.add_response('no')
+        nb.add_feature(feature)
+        return nb
+
+    def test_histogram_edges_differ(self):  # same name and number of bins, different bins
+        nb = MergeTest.build(HistogramFeature('age', 2, [20, 40]))
+        with self.assertRaisesRegex(ValueError, 'edges'):
+            nb.merge(MergeTest.build(HistogramFeature('age', 2, [30, 60])))
+
+    def test_gaussian_differs(self):
+        nb = MergeTest.build(GaussianFeature('age', 2))
+        with self.assertRaisesRegex(ValueError, 'kind'):
+            nb.merge(MergeTest.build(HistogramFeature('age', 2, [20, 40])))
+        with self.assertRaisesRegex(ValueError, 'variance_smoothing'):
+            nb.merge(MergeTest.build(GaussianFeature('age', 2, variance_smoothing = 0.5)))
+
+
+if __name__ == "__main__":
+    unittest.main()